@@ -6,15 +6,31 @@ This script initializes the medical knowledge base with sample medical informati
 Run this once after setting up the environment to populate the vector store.
 """
 
+import argparse
 import asyncio
 import sys
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent))
 
-from src.services.rag.service import ChromaRAGService
-from src.core.config import settings
+from src.services.rag.service import get_rag_service
+from src.core.config import get_settings
+
+# SQLite settings for --unsafe-fast bulk ingestion. Safe only because this
+# script is idempotent and can simply be re-run after a crash.
+BULK_INGEST_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+]
+RESTORE_PRAGMAS = [
+    "PRAGMA locking_mode=NORMAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+]
 
 # Sample medical knowledge
 MEDICAL_KNOWLEDGE = [
@@ -333,8 +349,56 @@ MEDICAL_KNOWLEDGE = [
     }
 ]
 
-def initialize_knowledge_base():
+def _chroma_sqlite_connection(rag_service):
+    """
+    Return the connection to Chroma's own SQLite file, or None if it is not reachable
+    
+    With the Rust bindings (chromadb >= 1.0) the store is opened in Rust and
+    no SqliteDB component is running. Asking the system for one would open a
+    second, unrelated connection whose PRAGMAs never reach the store's
+    writes, so only an already running SqliteDB is used, and only if its
+    main database is the store's chroma.sqlite3.
+    """
+    try:
+        from chromadb.db.impl.sqlite import SqliteDB
+        components = rag_service.chroma_client._system._instances.values()
+        db = next((component for component in components if isinstance(component, SqliteDB)), None)
+        if db is None:
+            return None
+        conn = db._conn_pool.connect()
+        databases = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    except Exception:
+        return None
+    
+    store_path = Path(get_settings().chroma_persist_directory) / "chroma.sqlite3"
+    main_path = databases.get("main")
+    if not main_path or Path(main_path).resolve() != store_path.resolve():
+        return None
+    return conn
+
+@contextmanager
+def unsafe_fast_ingest(rag_service):
+    """Relax SQLite durability for the duration of a bulk ingest"""
+    conn = _chroma_sqlite_connection(rag_service)
+    if conn is None:
+        print("✗ --unsafe-fast: this chromadb version does not expose the SQLite store to Python")
+        print("  (the Rust backend opens it itself), so its PRAGMAs cannot be changed.")
+        print("  Run again without --unsafe-fast.")
+        sys.exit(1)
+    
+    for pragma in BULK_INGEST_PRAGMAS:
+        conn.execute(pragma)
+    print("✓ Applied bulk ingest SQLite PRAGMAs")
+    try:
+        yield
+    finally:
+        for pragma in RESTORE_PRAGMAS:
+            conn.execute(pragma)
+        print("✓ Restored SQLite PRAGMAs")
+
+def initialize_knowledge_base(unsafe_fast: bool = False):
     """Initialize the medical knowledge base"""
+    settings = get_settings()
     print("Initializing Medical Knowledge Base...")
     print(f"Using model: {settings.model_name}")
     print(f"Using embeddings: {settings.embedding_model}")
@@ -343,27 +407,31 @@ def initialize_knowledge_base():
     
     # Initialize RAG service
     print("Creating RAG service...")
-    rag_service = ChromaRAGService()
+    rag_service = get_rag_service()
     print("✓ RAG service created")
     print(f"✓ Knowledge graph initialized with medical entities")
     print()
     
-    # Ingest medical knowledge
+    # Ingest medical knowledge in one batched call
     print("Ingesting medical knowledge...")
-    total_chunks = 0
-    
+    contents = []
+    sources = []
     for i, knowledge in enumerate(MEDICAL_KNOWLEDGE, 1):
         title = knowledge["title"]
-        content = f"# {title}\n\n{knowledge['content']}"
-        
-        print(f"  [{i}/{len(MEDICAL_KNOWLEDGE)}] Ingesting: {title}...")
-        chunks = rag_service.ingest_text(content, source=f"medical_kb_{title.lower().replace(' ', '_')}")
-        total_chunks += chunks
-        print(f"     ✓ Added {chunks} chunks")
+        print(f"  [{i}/{len(MEDICAL_KNOWLEDGE)}] Preparing: {title}...")
+        contents.append(f"# {title}\n\n{knowledge['content']}")
+        sources.append(f"medical_kb_{title.lower().replace(' ', '_')}")
     
+    if unsafe_fast:
+        with unsafe_fast_ingest(rag_service):
+            total_chunks = rag_service.ingest_texts(contents, sources)
+    else:
+        total_chunks = rag_service.ingest_texts(contents, sources)
+    print(f"     ✓ Added {total_chunks} chunks")
     print()
     print(f"✓ Successfully ingested {len(MEDICAL_KNOWLEDGE)} medical topics")
-    print(f"✓ Total chunks created: {total_chunks}")
+    # Chunks from an earlier run are found by content hash and not embedded again
+    print(f"✓ New chunks embedded: {total_chunks} (chunks already in the store are skipped)")
     print()
     print("Knowledge base initialization complete!")
     print()
@@ -371,8 +439,16 @@ def initialize_knowledge_base():
     print("  python -m src.main")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Initialize the medical knowledge base")
+    parser.add_argument(
+        "--unsafe-fast",
+        action="store_true",
+        help="Disable SQLite journaling and syncing during ingestion (re-run the script if it crashes)"
+    )
+    args = parser.parse_args()
+    
     try:
-        initialize_knowledge_base()
+        initialize_knowledge_base(unsafe_fast=args.unsafe_fast)
     except Exception as e:
         print(f"✗ Error initializing knowledge base: {str(e)}")
         import traceback
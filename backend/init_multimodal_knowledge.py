@@ -5,15 +5,19 @@ Multimodal Knowledge Initializer
 Example script showing how to ingest both text and images into the knowledge base.
 """
 
-import base64
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent))
 
-from src.services.rag.service import ChromaRAGService
-from src.core.config import settings
+from src.services.rag.service import ChromaRAGService, get_rag_service
+from src.services.vision import decode_data_url, get_image_processor
+from src.core.config import get_settings
+
+# Vision analysis is network-bound, so keep several images in flight at once
+MAX_IMAGE_WORKERS = 16
 
 def create_sample_xray_image():
     """
@@ -24,8 +28,23 @@ def create_sample_xray_image():
     sample_image_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
     return f"data:image/png;base64,{sample_image_base64}"
 
+def ingest_image_file(rag_service: ChromaRAGService, img_path: Path) -> dict:
+    """Load one image file and ingest it with automatic analysis"""
+    # Raw file bytes go straight to the service; no base64 round trip
+    image_bytes = img_path.read_bytes()
+    mime = "image/png" if img_path.suffix.lower() == ".png" else "image/jpeg"
+    
+    return rag_service.ingest_multimodal(
+        text=f"Medical image from file: {img_path.name}",
+        image_data=image_bytes,
+        mime=mime,
+        source=f"file_{img_path.stem}",
+        save_image=True
+    )
+
 def ingest_sample_multimodal_data():
     """Ingest sample multimodal medical data"""
+    settings = get_settings()
     
     print("Initializing Multimodal Medical Knowledge Base...")
     print(f"Using model: {settings.model_name}")
@@ -36,7 +55,7 @@ def ingest_sample_multimodal_data():
     
     # Initialize RAG service
     print("Creating RAG service...")
-    rag_service = ChromaRAGService()
+    rag_service = get_rag_service()
     print("✓ RAG service created")
     print()
     
@@ -75,11 +94,9 @@ def ingest_sample_multimodal_data():
     print()
     
     # In production, you would load real images like this:
-    # with open("chest_xray.jpg", "rb") as f:
-    #     image_data = base64.b64encode(f.read()).decode()
-    #     image_data = f"data:image/jpeg;base64,{image_data}"
+    # image_bytes = Path("chest_xray.jpg").read_bytes()
     
-    sample_image = create_sample_xray_image()
+    sample_image, sample_mime = decode_data_url(create_sample_xray_image())
     
     xray_report = """
     Patient presents with persistent cough and fever.
@@ -89,6 +106,7 @@ def ingest_sample_multimodal_data():
     result = rag_service.ingest_multimodal(
         text=xray_report,
         image_data=sample_image,
+        mime=sample_mime,
         source="multimodal_example",
         save_image=True
     )
@@ -116,27 +134,26 @@ def ingest_sample_multimodal_data():
         if image_files:
             print(f"Found {len(image_files)} images")
             
-            for img_path in image_files:
-                print(f"\nProcessing: {img_path.name}")
-                
-                # Load image
-                with open(img_path, "rb") as f:
-                    image_data = base64.b64encode(f.read()).decode()
-                    image_data = f"data:image/jpeg;base64,{image_data}"
-                
-                # Ingest with automatic analysis
-                result = rag_service.ingest_multimodal(
-                    text=f"Medical image from file: {img_path.name}",
-                    image_data=image_data,
-                    source=f"file_{img_path.stem}",
-                    save_image=True
-                )
+            with ThreadPoolExecutor(max_workers=min(MAX_IMAGE_WORKERS, len(image_files))) as executor:
+                futures = {
+                    executor.submit(ingest_image_file, rag_service, img_path): img_path
+                    for img_path in image_files
+                }
                 
-                if result['success']:
-                    print(f"  ✓ Chunks: {result['text_chunks']}")
-                    print(f"  ✓ Image ID: {result['image_id']}")
-                else:
-                    print(f"  ✗ Error: {result.get('error')}")
+                for future in as_completed(futures):
+                    img_path = futures[future]
+                    print(f"\nProcessed: {img_path.name}")
+                    
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                    
+                    if result['success']:
+                        print(f"  ✓ Chunks: {result['text_chunks']}")
+                        print(f"  ✓ Image ID: {result['image_id']}")
+                    else:
+                        print(f"  ✗ Error: {result.get('error')}")
         else:
             print("No images found in sample_data directory")
     else:
@@ -183,3 +200,7 @@ if __name__ == "__main__":
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        # Images are written by a daemon thread that dies with the process,
+        # so wait for queued saves before exiting
+        get_image_processor().flush_saves()
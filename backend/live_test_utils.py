@@ -0,0 +1,75 @@
+"""
+Shared helpers for the live-server test scripts
+
+Used by test_system.py and test_multimodal.py: one pooled HTTP session and
+a runner for tests that do not depend on each other.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# One pooled keep-alive session for every request, instead of a new
+# connection per call
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.1)
+)
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+
+class CapturedOutput:
+    """Lines written by one test, returned with its result instead of printed"""
+    
+    def __init__(self, width=60):
+        """
+        Args:
+            width: Width of the section header rule
+        """
+        self.width = width
+        self.lines = []
+    
+    def print(self, *values, sep=" "):
+        """Record a line, like print()"""
+        self.lines.append(sep.join(str(value) for value in values))
+    
+    def section(self, title):
+        """Record a section header"""
+        self.print("\n" + "=" * self.width)
+        self.print(f" {title}")
+        self.print("=" * self.width)
+    
+    def result(self, passed):
+        """Return (passed, output) for run_parallel/run_test"""
+        return passed, "\n".join(self.lines)
+
+def run_test(fn):
+    """
+    Run one test and print its output
+    
+    Returns:
+        Whether the test passed
+    """
+    passed, output = fn()
+    print(output)
+    return passed
+
+def run_parallel(tests, max_workers=8):
+    """
+    Run independent tests concurrently
+    
+    Each test returns (passed, output). The output is printed in one piece
+    as each test finishes, so sections from different tests do not interleave.
+    
+    Returns:
+        List of (name, passed) in the order the tests were given
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fn): name for name, fn in tests}
+        for future in as_completed(futures):
+            print(future.result()[1])
+    
+    return [(name, future.result()[0]) for future, name in futures.items()]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Chroma HNSW Migration
+
+Rebuilds the Chroma collection with the HNSW parameters from settings
+(CHROMA_HNSW_SPACE, CHROMA_HNSW_CONSTRUCTION_EF, CHROMA_HNSW_M,
+CHROMA_HNSW_SEARCH_EF). Chroma fixes these when a collection is created,
+so existing collections keep their old index until migrated. Stored
+embeddings are copied as-is; nothing is re-embedded.
+"""
+
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent))
+
+from src.services.rag.service import get_rag_service, hnsw_metadata
+from src.core.config import get_settings
+
+
+def migrate_collection():
+    """Copy the collection into a new one with hnsw_metadata() and swap it in"""
+    settings = get_settings()
+    print("Opening vector store...")
+    rag_service = get_rag_service()
+    client = rag_service.chroma_client
+    source = rag_service.vectorstore._collection
+    temp_name = f"{settings.collection_name}_hnsw_migration"
+    backup_name = f"{settings.collection_name}_hnsw_backup"
+    
+    print(f"Current HNSW configuration: {(source.configuration or {}).get('hnsw')}")
+    print(f"Target HNSW metadata: {hnsw_metadata()}")
+    
+    existing = [collection.name for collection in client.list_collections()]
+    # A backup means an earlier run stopped mid-swap; it may hold the only copy
+    if backup_name in existing:
+        raise RuntimeError(
+            f"Collection {backup_name} from an interrupted migration exists. "
+            f"Check it and rename it back to {settings.collection_name} or delete it, then re-run."
+        )
+    # A leftover copy from an interrupted run is incomplete; start over
+    if temp_name in existing:
+        client.delete_collection(temp_name)
+    target = client.create_collection(temp_name, metadata=hnsw_metadata())
+    
+    batch_size = settings.ingest_batch_size
+    total = source.count()
+    for offset in range(0, total, batch_size):
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        target.add(
+            ids=batch["ids"],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"]
+        )
+        print(f"  Copied {min(offset + batch_size, total)}/{total} chunks")
+    
+    if target.count() != total:
+        raise RuntimeError(f"Copied {target.count()} of {total} chunks; {settings.collection_name} left unchanged")
+    
+    # Swap by renaming so the original is only deleted once the copy has its name
+    source.modify(name=backup_name)
+    try:
+        target.modify(name=settings.collection_name)
+    except BaseException:
+        source.modify(name=settings.collection_name)
+        raise
+    client.delete_collection(backup_name)
+    
+    print()
+    print(f"✓ Rebuilt {settings.collection_name} with {target.count()} chunks")
+    print(f"✓ New HNSW configuration: {target.configuration.get('hnsw')}")
+
+if __name__ == "__main__":
+    try:
+        migrate_collection()
+    except Exception as e:
+        print(f"✗ Error migrating collection: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
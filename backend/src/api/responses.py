@@ -0,0 +1,18 @@
+"""
+Response Classes
+
+Endpoints with a response_model are serialized straight to JSON bytes by
+Pydantic. Responses built by hand (error handlers, 202 job responses) use
+ORJSONResponse instead of Starlette's stdlib-json JSONResponse.
+"""
+
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -1,9 +1,23 @@
-from fastapi import APIRouter, HTTPException
-from src.api.schemas import ChatRequest, ChatResponse, IngestRequest, IngestResponse, HealthResponse
-from src.services.agents.service import MedicalTriageAgent
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from src.api.responses import ORJSONResponse
+from src.api.schemas import (
+    ChatRequest, ChatResponse, IngestRequest, IngestResponse, IngestJobResponse, HealthResponse,
+    KnowledgeGraphQueryResponse, HybridSearchResponse
+)
 from src.services.rag.service import ChromaRAGService
+from src.services.vision import decode_data_url
+from src.core.config import get_settings
 from langsmith import traceable
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import binascii
 import logging
+import orjson
+import threading
+import time
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -11,14 +25,86 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize services (Singleton pattern)
-logger.info("Initializing RAG service...")
-rag_service = ChromaRAGService()
-logger.info("Initializing Medical Triage Agent...")
-agent_service = MedicalTriageAgent(rag_service)
-logger.info("Services initialized successfully")
+# Services (rag, agent, ingest_worker) are created once in
+# the app lifespan (see src.main) and read from request.app.state
 
-@router.get("/")
+# Exact-match caches for the read-only graph/search endpoints. The epoch is
+# part of every key and is bumped on ingest so new content is never masked.
+_cache_epoch = 0
+
+def _bump_cache_epoch():
+    """Invalidate cached knowledge graph and hybrid search results"""
+    global _cache_epoch
+    _cache_epoch += 1
+
+@cached(
+    TTLCache(maxsize=1024, ttl=300),
+    key=lambda rag_service, query: hashkey(_cache_epoch, query),
+    lock=threading.Lock()
+)
+def _cached_kg_query(rag_service: ChromaRAGService, query: str) -> str:
+    return rag_service.query_knowledge_graph(query)
+
+@cached(
+    TTLCache(maxsize=1024, ttl=300),
+    key=lambda rag_service, query, k, where_items: hashkey(_cache_epoch, query, k, where_items),
+    lock=threading.Lock()
+)
+def _cached_hybrid_search(
+    rag_service: ChromaRAGService, query: str, k: int, where_items: Tuple[Tuple[str, str], ...]
+) -> List[Dict[str, Any]]:
+    return rag_service.hybrid_search(query, k=k, where=dict(where_items) or None)
+
+# Last health probe as (monotonic time, response), failed or not. Probes inside
+# the TTL are answered from here instead of querying the vector store.
+HEALTH_CACHE_TTL = 10.0
+HEALTH_PROBE_TIMEOUT = 0.5
+_last_health: Optional[Tuple[float, HealthResponse]] = None
+
+def _run_ingest(rag_service: ChromaRAGService, **kwargs) -> Dict[str, Any]:
+    """Ingestion job body; runs on the ingest worker pool"""
+    result = rag_service.ingest_multimodal(**kwargs)
+    if result["success"]:
+        _bump_cache_epoch()
+        logger.info(f"Successfully ingested {result['text_chunks']} chunks")
+        if result.get('image_id'):
+            logger.info(f"Stored image with ID: {result['image_id']}")
+    return result
+
+def _ingest_response(result: Dict[str, Any]) -> IngestResponse:
+    return IngestResponse(
+        success=True,
+        text_chunks=result["text_chunks"],
+        image_id=result.get("image_id"),
+        image_analysis=result.get("image_analysis"),
+        message=f"Successfully ingested content with {result['text_chunks']} chunks"
+    )
+
+def _job_response(job: Dict[str, Any]) -> IngestJobResponse:
+    result = job["result"]
+    return IngestJobResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        result=_ingest_response(result) if job["status"] == "completed" else None,
+        error=job["error"]
+    )
+
+def _decode_data_url(image: str) -> Tuple[bytes, str]:
+    """Decode an uploaded base64 image once at the API boundary"""
+    try:
+        return decode_data_url(image)
+    except (binascii.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+
+def _sse_event(token: str) -> bytes:
+    """Format a response token as a server-sent event frame"""
+    return b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+
+def _sse_error_event(detail: str) -> bytes:
+    """Format a mid-stream failure as a server-sent `error` event frame"""
+    return b"event: error\ndata: " + orjson.dumps({"detail": detail}) + b"\n\n"
+
+@router.get("/", response_class=ORJSONResponse)
 async def root():
     """Root endpoint"""
     return {
@@ -29,27 +115,41 @@ async def root():
     }
 
 @router.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(http_request: Request):
     """Health check endpoint"""
+    global _last_health
+    if _last_health and time.monotonic() - _last_health[0] < HEALTH_CACHE_TTL:
+        return _last_health[1]
+    
+    rag_service = http_request.app.state.rag
     try:
-        # Test RAG service
+        # Test RAG service with a local collection count; a search would
+        # embed the probe query through the OpenAI API
         rag_status = "ok"
         try:
-            rag_service.similarity_search("test", k=1)
+            await asyncio.wait_for(
+                asyncio.to_thread(rag_service.vectorstore._collection.count),
+                timeout=HEALTH_PROBE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            rag_status = f"error: no response within {HEALTH_PROBE_TIMEOUT}s"
         except Exception as e:
             rag_status = f"error: {str(e)}"
         
-        return HealthResponse(
+        response = HealthResponse(
             status="healthy",
             rag_service=rag_status,
             agent_service="ok"
         )
+        # Failures are cached too, so an outage does not trigger a probe per request
+        _last_health = (time.monotonic(), response)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat", response_model=ChatResponse)
 @traceable(name="chat_endpoint")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Main chat endpoint for medical triage
     
@@ -58,14 +158,41 @@ async def chat(request: ChatRequest):
     2. RAG Agent searches knowledge base
     3. Triage Agent assesses risk
     4. Routes to appropriate agent (self-care, doctor referral, or clarification)
+    
+    With stream=true the response is sent as text/event-stream frames of
+    the form `data: {"token": "..."}`, terminated by `data: [DONE]`. If
+    generation fails mid-stream, the stream ends with an
+    `event: error` frame carrying `{"detail": "..."}` instead.
     """
+    agent_service = http_request.app.state.agent
     try:
         logger.info(f"Processing message: {request.message[:50]}...")
         
-        response = agent_service.process_message(
+        if request.stream:
+            async def event_generator():
+                # Errors after the response has started cannot become an HTTP
+                # status, so they are logged and sent as an error event
+                try:
+                    async for token in agent_service.stream_message(
+                        message=request.message,
+                        history=request.history,
+                        image=request.image,
+                        no_cache=request.no_cache
+                    ):
+                        yield _sse_event(token)
+                except Exception as e:
+                    logger.exception("Error streaming chat response")
+                    yield _sse_error_event(f"Error processing your request: {str(e)}")
+                    return
+                yield b"data: [DONE]\n\n"
+            
+            return StreamingResponse(event_generator(), media_type="text/event-stream")
+        
+        response = await agent_service.process_message(
             message=request.message,
             history=request.history,
-            image=request.image
+            image=request.image,
+            no_cache=request.no_cache
         )
         
         logger.info("Message processed successfully")
@@ -78,9 +205,13 @@ async def chat(request: ChatRequest):
             detail=f"Error processing your request: {str(e)}"
         )
 
-@router.post("/ingest", response_model=IngestResponse)
+@router.post(
+    "/ingest",
+    response_model=IngestResponse,
+    responses={202: {"model": IngestJobResponse, "description": "Ingestion queued or still running"}}
+)
 @traceable(name="ingest_endpoint")
-async def ingest(request: IngestRequest):
+async def ingest(request: IngestRequest, http_request: Request):
     """
     Ingest multimodal medical knowledge into the vector store
     
@@ -90,7 +221,14 @@ async def ingest(request: IngestRequest):
     - Combined text + image (radiology reports with images)
     
     Images are automatically analyzed using Vision AI and embedded alongside text.
+    
+    Ingestion runs on a background worker. With wait=false the endpoint
+    returns 202 and a job ID right away; otherwise it waits up to
+    INGEST_WAIT_TIMEOUT seconds and falls back to 202 if the job is still
+    running. Poll /ingest/status/{job_id} for the outcome.
     """
+    state = http_request.app.state
+    ingest_worker = state.ingest_worker
     try:
         if not request.text and not request.image:
             raise HTTPException(
@@ -100,31 +238,33 @@ async def ingest(request: IngestRequest):
         
         logger.info(f"Ingesting multimodal content from source: {request.source}")
         
-        # Use multimodal ingestion
-        result = rag_service.ingest_multimodal(
+        image_bytes, mime = _decode_data_url(request.image) if request.image else (None, "image/jpeg")
+        
+        job_id = ingest_worker.submit(
+            _run_ingest,
+            state.rag,
             text=request.text,
-            image_data=request.image,
+            image_data=image_bytes,
+            mime=mime,
             source=request.source,
             save_image=request.save_image
         )
         
-        if not result["success"]:
+        if request.wait:
+            job = await ingest_worker.wait(job_id, get_settings().ingest_wait_timeout)
+        else:
+            job = ingest_worker.status(job_id)
+        
+        if job["status"] == "failed":
             raise HTTPException(
                 status_code=500,
-                detail=f"Ingestion failed: {result.get('error', 'Unknown error')}"
+                detail=f"Ingestion failed: {job['error']}"
             )
+        if job["status"] == "completed":
+            return _ingest_response(job["result"])
         
-        logger.info(f"Successfully ingested {result['text_chunks']} chunks")
-        if result.get('image_id'):
-            logger.info(f"Stored image with ID: {result['image_id']}")
-        
-        return IngestResponse(
-            success=True,
-            text_chunks=result["text_chunks"],
-            image_id=result.get("image_id"),
-            image_analysis=result.get("image_analysis"),
-            message=f"Successfully ingested content with {result['text_chunks']} chunks"
-        )
+        logger.info(f"Ingestion job {job_id} accepted")
+        return ORJSONResponse(status_code=202, content=_job_response(job).model_dump())
         
     except HTTPException:
         raise
@@ -135,16 +275,24 @@ async def ingest(request: IngestRequest):
             detail=f"Error ingesting content: {str(e)}"
         )
 
-@router.get("/knowledge-graph/query")
+@router.get("/ingest/status/{job_id}", response_model=IngestJobResponse)
+async def ingest_status(job_id: str, http_request: Request):
+    """Get the status of a background ingestion job"""
+    job = http_request.app.state.ingest_worker.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return _job_response(job)
+
+@router.get("/knowledge-graph/query", response_model=KnowledgeGraphQueryResponse)
 @traceable(name="kg_query_endpoint")
-async def query_knowledge_graph(query: str):
+async def query_knowledge_graph(query: str, http_request: Request):
     """
     Query the medical knowledge graph directly
     
     Returns relationships and entities from the graph
     """
     try:
-        result = rag_service.query_knowledge_graph(query)
+        result = _cached_kg_query(http_request.app.state.rag, query)
         return {
             "query": query,
             "result": result
@@ -155,16 +303,27 @@ async def query_knowledge_graph(query: str):
             detail=f"Error querying knowledge graph: {str(e)}"
         )
 
-@router.get("/knowledge-graph/search")
+@router.get("/knowledge-graph/search", response_model=HybridSearchResponse)
 @traceable(name="hybrid_search_endpoint")
-async def hybrid_search(query: str, k: int = 4):
+async def hybrid_search(
+    query: str,
+    http_request: Request,
+    k: int = 4,
+    source: Optional[str] = None,
+    type: Optional[str] = None
+):
     """
-    Perform hybrid search using both vector store and knowledge graph
+    Perform hybrid search over the vector store, BM25 index and knowledge graph
     
-    Combines semantic search with graph relationships
+    Results from the three retrievers are fused with Reciprocal Rank Fusion;
+    each result lists the retrievers that returned it. Passing source and/or
+    type restricts the vector and BM25 searches to chunks with that metadata
     """
+    where_items = tuple((key, value) for key, value in (("source", source), ("type", type)) if value is not None)
     try:
-        results = rag_service.hybrid_search(query, k=k)
+        results = await asyncio.to_thread(
+            _cached_hybrid_search, http_request.app.state.rag, query, k, where_items
+        )
         return {
             "query": query,
             "results": results
@@ -1,9 +1,15 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Optional
+from typing_extensions import TypedDict
+
+class HistoryMsg(TypedDict, total=False):
+    """A previous chat turn with role ("user", "assistant" or "bot") and content"""
+    role: str
+    content: str
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="User's medical query or message")
-    history: Optional[List[Dict[str, str]]] = Field(
+    history: Optional[List[HistoryMsg]] = Field(
         default=[],
         description="Chat history with role and content keys"
     )
@@ -11,28 +17,40 @@ class ChatRequest(BaseModel):
         default=None,
         description="Base64 encoded image string (for future vision support)"
     )
+    stream: Optional[bool] = Field(
+        default=False,
+        description="Stream the response as server-sent events instead of returning a ChatResponse"
+    )
+    no_cache: Optional[bool] = Field(
+        default=False,
+        description="Bypass the semantic response cache and always run the full triage workflow"
+    )
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "message": "I have a persistent cough and mild fever for 3 days",
                 "history": [
                     {"role": "user", "content": "Hello"},
                     {"role": "bot", "content": "Hi! I'm here to help with your health concerns."}
                 ],
-                "image": None
+                "image": None,
+                "stream": False
             }
         }
+    )
 
 class ChatResponse(BaseModel):
+    """Response body for non-streaming chat requests"""
     response: str = Field(..., description="AI-generated medical guidance response")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "response": "Based on your symptoms of persistent cough and mild fever..."
             }
         }
+    )
 
 class IngestRequest(BaseModel):
     text: Optional[str] = Field(
@@ -51,25 +69,52 @@ class IngestRequest(BaseModel):
         default=True,
         description="Whether to save the image to disk"
     )
+    wait: Optional[bool] = Field(
+        default=True,
+        description="Wait for ingestion to finish; if false, return 202 with a job ID immediately"
+    )
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "text": "Patient presents with chest X-ray showing opacity in right lower lobe",
                 "image": "data:image/jpeg;base64,/9j/4AAQSkZJRg...",
                 "source": "radiology_report",
-                "save_image": True
+                "save_image": True,
+                "wait": True
             }
         }
+    )
 
 class IngestResponse(BaseModel):
     success: bool = Field(..., description="Whether ingestion was successful")
-    text_chunks: int = Field(..., description="Number of text chunks created")
+    text_chunks: int = Field(..., description="Number of text chunks added (already stored chunks are not counted)")
     image_id: Optional[str] = Field(None, description="ID of the stored image")
     image_analysis: Optional[str] = Field(None, description="AI analysis of the image")
     message: str = Field(..., description="Status message")
 
+class IngestJobResponse(BaseModel):
+    """Response body for ingestion jobs accepted for background processing"""
+    job_id: str = Field(..., description="ID to poll at /ingest/status/{job_id}")
+    status: str = Field(..., description="Job status: pending, running, completed or failed")
+    result: Optional[IngestResponse] = Field(None, description="Ingestion result once completed")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+
 class HealthResponse(BaseModel):
     status: str = Field(..., description="Overall system health status")
     rag_service: str = Field(..., description="RAG service status")
     agent_service: str = Field(..., description="Agent service status")
+
+class KnowledgeGraphQueryResponse(BaseModel):
+    query: str = Field(..., description="The original query")
+    result: str = Field(..., description="Matching graph entities and their relationships")
+
+class SearchResult(BaseModel):
+    content: str = Field(..., description="Chunk text, or the knowledge graph context")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Chunk metadata")
+    score: float = Field(..., description="Reciprocal Rank Fusion score (higher is more relevant)")
+    sources: List[str] = Field(..., description="Retrievers that returned this result: vector, bm25 or graph")
+
+class HybridSearchResponse(BaseModel):
+    query: str = Field(..., description="The original query")
+    results: List[SearchResult] = Field(..., description="Fused vector, BM25 and graph results, best first")
@@ -10,7 +10,12 @@ class BaseLLMService(ABC):
 class BaseVectorStore(ABC):
     @abstractmethod
     def ingest_text(self, text: str, source: str) -> int:
-        """Ingest text into the vector store."""
+        """Ingest text into the vector store, returning the number of chunks added."""
+        pass
+
+    @abstractmethod
+    def ingest_texts(self, texts: List[str], sources: List[str]) -> int:
+        """Ingest several texts into the vector store in batches, returning the number of chunks added."""
         pass
 
     @abstractmethod
@@ -1,49 +1,113 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 
-load_dotenv()
-
 class Settings(BaseSettings):
     # OpenAI Configuration
-    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
-    model_name: str = os.getenv("MODEL_NAME", "gpt-4o-mini")
-    vision_model: str = os.getenv("VISION_MODEL", "gpt-4o-mini")
-    embedding_model: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    openai_api_key: str = ""
+    model_name: str = "gpt-4o-mini"
+    vision_model: str = "gpt-4o-mini"
+    embedding_model: str = "text-embedding-3-small"
+    # "openai", "late_chunking" (local long-context model) or "local" (ONNX
+    # bge model). Vectors from different backends are not compatible, so use
+    # a fresh collection (or re-ingest) when switching
+    embedding_backend: str = "openai"
+    late_chunking_model: str = "jinaai/jina-embeddings-v2-small-en"
+    local_embedding_model_dir: str = "./models/bge-small-en-v1.5"
+    local_embedding_model_file: str = "model_int8.onnx"
+    # Per-request limits for embedding calls (OpenAI allows 2048 inputs per request)
+    embedding_batch_size: int = 2048
+    embedding_batch_max_tokens: int = 250000
+    # Shared HTTP/2 pool for all OpenAI calls (see src/core/http.py)
+    http_max_connections: int = 200
+    http_max_keepalive_connections: int = 100
+    http_timeout: float = 30  # seconds
     
     # Image Storage Configuration
-    image_storage_dir: str = os.getenv("IMAGE_STORAGE_DIR", "./medical_images")
-    max_image_size_mb: int = int(os.getenv("MAX_IMAGE_SIZE_MB", "10"))
+    image_storage_dir: str = "./medical_images"
+    max_image_size_mb: int = 10
+    # Images sent to the Vision API are downscaled to fit this edge length
+    # (stored images keep their original resolution)
+    vision_max_edge: int = 1024
+    vision_jpeg_quality: int = 85
     
     # LangSmith Configuration
-    langchain_tracing_v2: str = os.getenv("LANGCHAIN_TRACING_V2", "true")
-    langchain_endpoint: str = os.getenv("LANGCHAIN_ENDPOINT", "https://api.smith.langchain.com")
-    langchain_api_key: str = os.getenv("LANGCHAIN_API_KEY", "")
-    langchain_project: str = os.getenv("LANGCHAIN_PROJECT", "medical-triage-system")
+    langchain_tracing_v2: str = "true"
+    langchain_endpoint: str = "https://api.smith.langchain.com"
+    langchain_api_key: str = ""
+    langchain_project: str = "medical-triage-system"
     
     # ChromaDB Configuration
-    chroma_persist_directory: str = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
-    collection_name: str = os.getenv("COLLECTION_NAME", "medical_knowledge")
+    chroma_persist_directory: str = "./chroma_db"
+    collection_name: str = "medical_knowledge"
+    # HNSW index parameters. search_ef is applied to existing collections on
+    # startup; the others only take effect on new collections (see
+    # migrate_chroma_hnsw.py)
+    chroma_hnsw_space: str = "cosine"
+    chroma_hnsw_construction_ef: int = 200
+    chroma_hnsw_m: int = 16
+    chroma_hnsw_search_ef: int = 32
+    
+    # Vector Store Backend ("chroma" or "faiss")
+    vector_store: str = "chroma"
+    
+    # FAISS Configuration
+    faiss_index_dir: str = "./faiss_index"
+    faiss_quantization: str = "sq8"  # "sq8" or "none"
+    faiss_sq_train_size: int = 1000
+    faiss_train_size: int = 50000
+    faiss_nlist: int = 4096
+    faiss_nprobe: int = 16
+    faiss_pq_m: int = 16
+    faiss_pq_nbits: int = 8
+    faiss_mmap: bool = False
     
     # Neo4j Configuration
-    neo4j_uri: str = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-    neo4j_user: str = os.getenv("NEO4J_USER", "neo4j")
-    neo4j_password: str = os.getenv("NEO4J_PASSWORD", "password")
+    neo4j_uri: str = "bolt://localhost:7687"
+    neo4j_user: str = "neo4j"
+    neo4j_password: str = "password"
     
     # Application Settings
-    max_tokens: int = int(os.getenv("MAX_TOKENS", "1000"))
-    temperature: float = float(os.getenv("TEMPERATURE", "0.7"))
-    chunk_size: int = int(os.getenv("CHUNK_SIZE", "1000"))
-    chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    max_tokens: int = 1000
+    temperature: float = 0.7
+    chunk_size: int = 1000
+    chunk_overlap: int = 200
+    # Retrieved knowledge passed to the agents is compressed to this budget
+    max_context_tokens: int = 1500
+    context_sentences_per_chunk: int = 3
+    # Chat turns sent verbatim to the responders; older turns are summarized
+    history_turns: int = 6
+    
+    # Semantic Cache Configuration
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_entries: int = 10000
+    semantic_cache_ttl: float = 3600  # seconds, 0 disables expiry
+    exact_cache_max_entries: int = 10000  # exact-repeat tier, shares the TTL
+    ingest_batch_size: int = 200
+    
+    # Background Ingestion Configuration
+    ingest_workers: int = 4
+    ingest_wait_timeout: float = 30
     
     class Config:
         env_file = ".env"
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Load settings once per process, on first use
+    
+    Fields are read from the environment and .env by pydantic-settings, so
+    call this where the values are needed rather than at import time.
+    """
+    return Settings()
 
-# Set environment variables for LangSmith tracing
-os.environ["LANGCHAIN_TRACING_V2"] = settings.langchain_tracing_v2
-os.environ["LANGCHAIN_ENDPOINT"] = settings.langchain_endpoint
-os.environ["LANGCHAIN_API_KEY"] = settings.langchain_api_key
-os.environ["LANGCHAIN_PROJECT"] = settings.langchain_project
-os.environ["OPENAI_API_KEY"] = settings.openai_api_key
+def configure_langsmith() -> None:
+    """Export LangSmith tracing settings to the environment"""
+    settings = get_settings()
+    os.environ["LANGCHAIN_TRACING_V2"] = settings.langchain_tracing_v2
+    os.environ["LANGCHAIN_ENDPOINT"] = settings.langchain_endpoint
+    os.environ["LANGCHAIN_API_KEY"] = settings.langchain_api_key
+    os.environ["LANGCHAIN_PROJECT"] = settings.langchain_project
+    os.environ["OPENAI_API_KEY"] = settings.openai_api_key
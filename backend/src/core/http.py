@@ -0,0 +1,47 @@
+"""
+Shared HTTP Clients
+
+One pooled HTTP/2 client per process for all OpenAI traffic (chat, vision,
+embeddings), so back-to-back calls reuse connections instead of each
+model wrapper opening its own pool and TLS sessions.
+"""
+
+from functools import lru_cache
+import httpx
+
+from src.core.config import get_settings
+
+
+def _client_options() -> dict:
+    """Pool limits and timeout shared by both clients"""
+    settings = get_settings()
+    return {
+        "http2": True,
+        "limits": httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections
+        ),
+        "timeout": httpx.Timeout(settings.http_timeout)
+    }
+
+
+@lru_cache
+def get_http_client() -> httpx.Client:
+    """Shared client for synchronous OpenAI calls"""
+    return httpx.Client(**_client_options())
+
+
+@lru_cache
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared client for asynchronous OpenAI calls"""
+    return httpx.AsyncClient(**_client_options())
+
+
+async def close_http_clients():
+    """Close the shared clients if they were created"""
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+        get_http_client.cache_clear()
+    if get_async_http_client.cache_info().currsize:
+        await get_async_http_client().aclose()
+        get_async_http_client.cache_clear()
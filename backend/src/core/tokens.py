@@ -0,0 +1,44 @@
+"""
+Token Counting
+
+tiktoken helpers shared by embedding batching and prompt budgeting. The
+BPE files are downloaded on first use; when they cannot be loaded (e.g.
+offline) counts fall back to an estimate of ~4 characters per token.
+"""
+
+from functools import lru_cache
+from typing import List, Optional
+import tiktoken
+
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """Tokenizer for a model, or None if it cannot be loaded"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(texts: List[str], model: str) -> List[int]:
+    """Count tokens per text"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [len(text) // CHARS_PER_TOKEN + 1 for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -1,7 +1,15 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+from src.api.responses import ORJSONResponse
 from src.api.routes import router
+from src.core.config import configure_langsmith, get_settings
+from src.core.http import close_http_clients
+from src.services.agents.service import MedicalTriageAgent
+from src.services.rag.service import get_rag_service
+from src.services.jobs import IngestWorker
+from src.services.vision import get_image_processor
 import uvicorn
 import logging
 import sys
@@ -17,13 +25,42 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared services once per process and tear them down on exit"""
+    settings = get_settings()
+    configure_langsmith()
+    logger.info("=" * 60)
+    logger.info("Medical Triage System Starting...")
+    logger.info("=" * 60)
+    
+    logger.info("Initializing RAG service...")
+    app.state.rag = get_rag_service()
+    logger.info("Initializing Medical Triage Agent...")
+    app.state.agent = MedicalTriageAgent(app.state.rag)
+    app.state.ingest_worker = IngestWorker(max_workers=settings.ingest_workers)
+    
+    logger.info("System initialized successfully")
+    logger.info("API Documentation: http://localhost:8000/docs")
+    logger.info("=" * 60)
+    
+    yield
+    
+    logger.info("Medical Triage System shutting down...")
+    app.state.ingest_worker.shutdown()
+    # Finish writing images that were queued for background saving
+    if get_image_processor.cache_info().currsize:
+        await asyncio.to_thread(get_image_processor().flush_saves)
+    await close_http_clients()
+
 # Create FastAPI app
 app = FastAPI(
     title="Medical Triage System",
     description="AI-powered medical triage system using LangGraph, LangChain, and OpenAI",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -39,7 +76,7 @@ app.add_middleware(
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global exception handler caught: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "detail": "An internal server error occurred",
@@ -47,21 +84,6 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    logger.info("=" * 60)
-    logger.info("Medical Triage System Starting...")
-    logger.info("=" * 60)
-    logger.info("System initialized successfully")
-    logger.info("API Documentation: http://localhost:8000/docs")
-    logger.info("=" * 60)
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Medical Triage System shutting down...")
-
 # Include API routes
 app.include_router(router)
 
@@ -71,6 +93,8 @@ if __name__ == "__main__":
         "src.main:app",
         host="0.0.0.0",
         port=8000,
+        loop="uvloop",
+        http="httptools",
         reload=True,
         log_level="info"
     )
@@ -1,23 +1,179 @@
-from typing import Annotated, TypedDict, Literal, List, Dict, Optional
+from typing import Annotated, TypedDict, Literal, List, Dict, Any, Optional, AsyncIterator, Tuple
+import asyncio
+import hashlib
+import logging
 import operator
+import re
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from langsmith import traceable
-from src.core.config import settings
+from pydantic import BaseModel, Field, model_validator
+from cachetools import LRUCache, TTLCache
+from src.core.config import get_settings
+from src.core.http import get_http_client, get_async_http_client
+from src.core.tokens import count_tokens, truncate_tokens
+from src.services.rag.bm25 import tokenize
 from src.services.rag.service import ChromaRAGService
-from src.services.vision.image_processor import image_processor
+from src.services.cache import SemanticCache
+from src.services.vision.image_processor import get_image_processor, decode_data_url
+
+logger = logging.getLogger(__name__)
+
+# Sentence boundaries used when compressing retrieved chunks
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+REJECT_MESSAGE = "I apologize, but I can only help with health and medical-related questions. Please ask a medical question, and I'll be happy to assist you."
+CLARIFICATION_PREFIX = "I need more information to help you better:\n\n"
+
+# System prompts are built once; identical leading messages also let the
+# provider reuse its prompt cache across requests
+ROUTER_SYSTEM_MESSAGE = SystemMessage(content="""You are a medical query router and triage assistant. Determine if a user's query is related to health, medical symptoms, or wellness, and if it is, assess its urgency.
+
+Medical queries include:
+- Symptoms and health concerns
+- Medical conditions and diseases
+- Medications and treatments
+- Health advice and wellness
+- Medical test results
+- Medical images (X-rays, CT scans, MRIs, etc.)
+
+Out of scope:
+- General conversation
+- Non-medical topics
+- Technical support
+
+For medical queries, assess the urgency/risk level (0-10 scale):
+- 0-3: Low risk (self-care appropriate)
+- 4-6: Medium risk (monitor, may need doctor)
+- 7-10: High risk (seek immediate medical attention)
+
+Consider severity, duration and combination of symptoms, and red flag
+symptoms (chest pain, difficulty breathing, severe bleeding, etc.).
+Set needs_clarification only if the query is too vague to assess.
+Set emergency only for unambiguous emergencies (e.g. crushing chest pain,
+stroke signs, severe bleeding, not breathing).
+Set retrieval_needed to false only when the answer needs no reference
+material: general wellness questions or emergencies. When unsure, set it
+to true.
+For out-of-scope queries set relevant to false and risk_score to 0.
+""")
+
+TRIAGE_SYSTEM_MESSAGE = SystemMessage(content="""You are an expert medical triage AI assistant. Analyze the patient's query and available medical knowledge to assess the urgency/risk level (0-10 scale):
+   - 0-3: Low risk (self-care appropriate)
+   - 4-6: Medium risk (monitor, may need doctor)
+   - 7-10: High risk (seek immediate medical attention)
+
+Consider:
+- Severity of symptoms
+- Duration of symptoms
+- Combination of symptoms
+- Red flag symptoms (chest pain, difficulty breathing, severe bleeding, etc.)
+- Medical imaging findings (X-rays, CT scans, MRIs, etc.) if provided
+- Visual abnormalities or concerning features in medical images
+""")
+
+SELF_CARE_SYSTEM_MESSAGE = SystemMessage(content="""You are a compassionate medical advisor for low-risk health concerns. Provide:
+
+1. Clear explanation of the likely condition
+2. Self-care recommendations
+3. When to seek medical attention
+4. General wellness advice
+
+Be warm, supportive, and clear. Always include a disclaimer that this is not a substitute for professional medical advice.""")
+
+CLARIFICATION_SYSTEM_MESSAGE = SystemMessage(content="""You are a medical intake specialist. When information is insufficient, ask specific follow-up questions to better assess the situation.
+
+Ask about:
+- Duration and severity of symptoms
+- Associated symptoms
+- Medical history if relevant
+- Current medications
+- Recent activities or exposures
+
+Be concise and ask 2-3 most important questions.""")
+
+DOCTOR_REFERRAL_SYSTEM_MESSAGE = SystemMessage(content="""You are a medical triage specialist for cases requiring professional medical attention.
+
+For medium-risk cases:
+- Explain why medical consultation is recommended
+- Suggest timeline (within 24-48 hours)
+- Provide interim care advice
+
+For high-risk cases:
+- Strongly recommend immediate medical attention
+- List warning signs
+- Suggest going to ER/urgent care if applicable
+
+Always be clear but not alarmist.""")
+
+HISTORY_SUMMARY_SYSTEM_MESSAGE = SystemMessage(content="""You maintain a running summary of a medical triage conversation. Update the current summary with the new messages.
+
+Keep symptoms and their duration, medications, relevant history, risk factors and advice already given. Drop small talk. Be concise (at most 150 words).""")
+
+RISK_LEVELS = ("low", "medium", "high")
+
+def risk_level_for_score(risk_score: int) -> str:
+    """Risk level implied by a 0-10 risk score"""
+    if risk_score <= 3:
+        return "low"
+    elif risk_score <= 6:
+        return "medium"
+    return "high"
+
+class TriageDecision(BaseModel):
+    """Structured relevance and risk assessment returned by the LLM"""
+    relevant: bool = Field(description="Whether the query is health or medical related")
+    risk_score: int = Field(ge=0, le=10, description="Urgency on a 0-10 scale, 0 if not relevant")
+    risk_level: Literal["low", "medium", "high"] = Field(description="low for 0-3, medium for 4-6, high for 7-10")
+    needs_clarification: bool = Field(description="Whether the query is too vague to assess without follow-up questions")
+    retrieval_needed: bool = Field(description="Whether answering needs the medical knowledge base; true when unsure")
+    emergency: bool = Field(description="Whether the query describes an unambiguous medical emergency")
+    reasoning: str = Field(description="Brief justification for the assessment")
+    
+    @model_validator(mode="after")
+    def _reconcile_risk_level(self) -> "TriageDecision":
+        """Routing uses risk_level, so a level below what the score implies is raised to match it"""
+        score_level = risk_level_for_score(self.risk_score)
+        if RISK_LEVELS.index(score_level) > RISK_LEVELS.index(self.risk_level):
+            self.risk_level = score_level
+        return self
+
+
+# Used when the structured response cannot be parsed; matches the old RISK_SCORE fallback
+DEFAULT_DECISION = TriageDecision(
+    relevant=True,
+    risk_score=5,
+    risk_level="medium",
+    needs_clarification=False,
+    retrieval_needed=True,
+    emergency=False,
+    reasoning=""
+)
+
 
 class MedicalTriageState(TypedDict):
-    """State for the medical triage system"""
-    messages: Annotated[List[BaseMessage], operator.add]
+    """
+    State for the medical triage system
+    
+    Nodes return only the keys they change. LangGraph merges those into
+    the state, and messages has an operator.add reducer, so returning it
+    from a node would append the whole list again.
+    """
+    messages: Annotated[List[BaseMessage], operator.add]  # Recent history turns plus the current message
+    history_summary: str  # Rolling summary of turns older than settings.history_turns
     query: str
     image_data: Optional[str]  # Base64 encoded image
     image_analysis: Optional[str]  # Vision model analysis
     is_relevant: bool
-    knowledge_context: str
+    retrieval_results: Optional[List[Dict[str, Any]]]  # Hybrid search results prefetched by the router
+    knowledge_context: str  # Compressed context passed to the agents
+    full_knowledge_context: str  # Uncompressed context, kept for logging and traces
     risk_score: int  # 0-10 scale
     risk_level: str  # "low", "medium", "high"
+    needs_clarification: bool
+    retrieval_needed: bool  # Router's view on whether the knowledge base can change the answer
+    emergency: bool
     recommendations: str
     needs_followup: bool
     current_agent: str
@@ -28,7 +184,7 @@ class MedicalTriageAgent:
     Multi-agent medical triage system using LangGraph
     
     Agents:
-    1. Router Agent - Validates query relevance
+    1. Router Agent - Validates query relevance and skips RAG when it cannot help
     2. RAG Agent - Searches knowledge graph
     3. Triage Agent - Analyzes risk
     4. Self-Care Agent - Provides low-risk advice
@@ -36,6 +192,7 @@ class MedicalTriageAgent:
     """
     
     def __init__(self, rag_service: ChromaRAGService):
+        settings = get_settings()
         self.rag_service = rag_service
         
         # Initialize LLM with LangSmith tracing
@@ -43,32 +200,54 @@ class MedicalTriageAgent:
             model=settings.model_name,
             temperature=settings.temperature,
             max_tokens=settings.max_tokens,
-            openai_api_key=settings.openai_api_key
+            openai_api_key=settings.openai_api_key,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client()
         )
+        self.decision_llm = self.llm.with_structured_output(TriageDecision, include_raw=True)
+        self.summary_llm = self.llm.bind(max_tokens=300)
+        # History prefix digest -> rolling summary, so each block of old turns is summarized once
+        self._summary_cache = LRUCache(maxsize=1024)
+        
+        # Near-duplicate questions are answered from here without running the
+        # graph. Exact repeats (retries, double submits) are caught first by a
+        # hash lookup that needs no query embedding
+        self.response_cache = None
+        self.exact_cache = None
+        if settings.semantic_cache_enabled:
+            self.response_cache = SemanticCache(
+                threshold=settings.semantic_cache_threshold,
+                max_entries=settings.semantic_cache_max_entries,
+                ttl=settings.semantic_cache_ttl
+            )
+            if settings.semantic_cache_ttl:
+                self.exact_cache = TTLCache(maxsize=settings.exact_cache_max_entries, ttl=settings.semantic_cache_ttl)
+            else:
+                self.exact_cache = LRUCache(maxsize=settings.exact_cache_max_entries)
+        
+        # Prompt builders for the terminal agents, keyed by route name
+        self._responder_messages = {
+            "self_care": self._self_care_messages,
+            "clarification": self._clarification_messages,
+            "doctor_referral": self._doctor_referral_messages
+        }
         
-        # Build the workflow graph
+        # Build the workflow graphs. The assessment graph stops after triage
+        # so streaming requests can generate the final answer themselves.
         self.graph = self._build_graph()
+        self.assessment_graph = self._build_graph(include_responders=False)
     
     @traceable(name="router_agent")
-    def router_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """Router Agent - Validates if query is medical-related"""
-        
-        system_prompt = """You are a medical query router. Your job is to determine if a user's query is related to health, medical symptoms, or wellness.
-        
-        Respond with ONLY 'RELEVANT' if the query is medical/health-related, or 'NOT_RELEVANT' if it's out of scope.
-        
-        Medical queries include:
-        - Symptoms and health concerns
-        - Medical conditions and diseases
-        - Medications and treatments
-        - Health advice and wellness
-        - Medical test results
-        - Medical images (X-rays, CT scans, MRIs, etc.)
-        
-        Out of scope:
-        - General conversation
-        - Non-medical topics
-        - Technical support
+    async def router_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """
+        Router Agent - Validates if query is medical-related and assesses its risk
+        
+        Relevance and risk come back from one structured LLM call, so the
+        triage step does not need a second round trip. Retrieval and image
+        analysis do not depend on that call, so they are started alongside
+        it and cancelled if the query turns out to be out of scope. Retrieval
+        is also cancelled when the decision routes around the RAG agent
+        (see route_after_router).
         """
         
         query = state.get("query", "")
@@ -80,61 +259,157 @@ class MedicalTriageAgent:
             query_context += "\n[Medical image attached]"
         
         messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Is this query medical-related? {query_context}")
+            ROUTER_SYSTEM_MESSAGE,
+            HumanMessage(content=f"Assess this query. {query_context}")
         ]
         
-        response = self.llm.invoke(messages)
-        is_relevant = "RELEVANT" in response.content.upper()
+        retrieval_task = asyncio.create_task(self._retrieve(query, image_data))
+        image_task = asyncio.create_task(self._analyze_image(query, image_data)) if image_data else None
+        prefetch = [task for task in (retrieval_task, image_task) if task is not None]
+        
+        try:
+            decision = await self._decide(messages)
+            if not decision.relevant:
+                return {
+                    "is_relevant": False,
+                    "current_agent": "router"
+                }
+            
+            update = {
+                "is_relevant": True,
+                "risk_score": decision.risk_score,
+                "risk_level": decision.risk_level,
+                "needs_clarification": decision.needs_clarification,
+                "retrieval_needed": decision.retrieval_needed,
+                "emergency": decision.emergency,
+                "current_agent": "router"
+            }
+            
+            if self.route_after_router({**state, **update}) == "rag":
+                retrieval_results = await retrieval_task
+            else:
+                await self._cancel([retrieval_task])
+                retrieval_results = []
+            image_analysis = await image_task if image_task else None
+        finally:
+            # On any early exit or failure, stop the prefetches still running
+            # and collect their exceptions so none is left unretrieved
+            await self._cancel(prefetch)
         
         return {
-            **state,
-            "is_relevant": is_relevant,
-            "current_agent": "router"
+            **update,
+            "retrieval_results": retrieval_results,
+            "image_analysis": image_analysis
         }
     
+    async def _retrieve(self, query: str, image_data: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Hybrid search for a query, restricted to multimodal chunks when an image is attached
+        
+        Falls back to an unfiltered search if no multimodal chunk matches,
+        so image queries still get text knowledge on a text-only corpus.
+        """
+        if image_data:
+            results = await self.rag_service.ahybrid_search(query, k=4, where={"type": "multimodal"})
+            if any(r["sources"] != ["graph"] for r in results):
+                return results
+        return await self.rag_service.ahybrid_search(query, k=4)
+    
+    async def _decide(self, messages: List[BaseMessage]) -> TriageDecision:
+        """Run the structured triage call, falling back to DEFAULT_DECISION on parse errors"""
+        result = await self.decision_llm.ainvoke(messages)
+        return result["parsed"] or DEFAULT_DECISION
+    
+    @staticmethod
+    async def _cancel(tasks: List[asyncio.Task]):
+        """Cancel speculative tasks and wait for them to unwind"""
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _analyze_image(self, query: str, image_data: str) -> Optional[str]:
+        """Run the vision model on an attached image, returning None on failure"""
+        try:
+            image_bytes, mime = decode_data_url(image_data)
+        except ValueError:  # binascii.Error on malformed base64
+            logger.warning("Ignoring attached image that is not valid base64")
+            return None
+        image_result = await get_image_processor().aanalyze_medical_image(
+            image_bytes=image_bytes,
+            mime=mime,
+            query=query,
+            save_image=True,
+            encoded=image_data
+        )
+        if image_result["success"]:
+            return image_result["analysis"]
+        return None
+    
     @traceable(name="rag_agent")
-    def rag_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """RAG Agent - Searches knowledge graph and vector store, analyzes images"""
+    async def rag_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """RAG Agent - Builds the knowledge context from graph, vector store and image results"""
+        settings = get_settings()
         
         query = state.get("query", "")
-        image_data = state.get("image_data")
-        image_analysis = None
+        image_analysis = state.get("image_analysis")
         
-        # Analyze image if provided
-        if image_data:
-            image_result = image_processor.analyze_medical_image(
-                image_data=image_data,
-                query=query,
-                save_image=True
+        # Hybrid search (vector + BM25 + knowledge graph) normally ran
+        # concurrently with the router; search now only if it was not prefetched
+        hybrid_results = state.get("retrieval_results")
+        if hybrid_results is None:
+            hybrid_results = await self._retrieve(query, state.get("image_data"))
+        
+        # Format context from the fused results, best first. Only the source
+        # is kept from the metadata; chunk and image IDs mean nothing to the LLM
+        full_context = self._format_results(hybrid_results, query, compress=False)
+        retrieved_context = self._format_results(hybrid_results, query, compress=True)
+        retrieved_context = truncate_tokens(retrieved_context, settings.max_context_tokens, settings.model_name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Compressed retrieved context from %d to %d tokens",
+                *count_tokens([full_context, retrieved_context], settings.model_name)
             )
-            if image_result["success"]:
-                image_analysis = image_result["analysis"]
         
-        # Perform hybrid search (vector + knowledge graph)
-        # Include image analysis in search query if available
-        search_query = query
-        if image_analysis:
-            search_query += f"\n\nImage findings: {image_analysis[:200]}"
+        knowledge_context = self._knowledge_context(retrieved_context, image_analysis)
         
-        hybrid_results = self.rag_service.hybrid_search(search_query, k=4)
-        
-        # Format context from vector results
-        vector_context = "\n\n".join([
-            f"[Source: {r['metadata'].get('source', 'unknown')}]\n{r['content']}"
-            for r in hybrid_results["vector_results"]
-        ])
-        
-        # Get knowledge graph results
-        graph_context = hybrid_results["graph_results"]
+        return {
+            "knowledge_context": knowledge_context,
+            "full_knowledge_context": self._knowledge_context(full_context, image_analysis),
+            "current_agent": "rag"
+        }
+    
+    @staticmethod
+    def _format_results(results: List[Dict[str, Any]], query: str, compress: bool) -> str:
+        """
+        Render hybrid search results for a prompt
         
-        # Combine contexts
+        With compress, each chunk is cut down to the
+        settings.context_sentences_per_chunk sentences sharing the most
+        terms with the query, kept in their original order. Chunks with no
+        overlapping sentence keep their leading sentences.
+        """
+        settings = get_settings()
+        query_terms = set(tokenize(query))
+        limit = settings.context_sentences_per_chunk
+        
+        sections = []
+        for r in results:
+            content = r["content"]
+            if compress:
+                sentences = [s.strip() for s in SENTENCE_BOUNDARY.split(content) if s.strip()]
+                if len(sentences) > limit:
+                    overlap = [len(query_terms.intersection(tokenize(s))) for s in sentences]
+                    best = sorted(range(len(sentences)), key=lambda i: (-overlap[i], i))[:limit]
+                    content = "\n".join(sentences[i] for i in sorted(best))
+            sections.append(f"[Source: {r['metadata'].get('source', 'unknown')}]\n{content}")
+        
+        return "\n\n".join(sections)
+    
+    @staticmethod
+    def _knowledge_context(retrieved_context: str, image_analysis: Optional[str]) -> str:
         knowledge_context = f"""
-        === Vector Search Results ===
-        {vector_context}
-        
-        === Knowledge Graph Results ===
-        {graph_context}
+        === Retrieved Knowledge ===
+        {retrieved_context}
         """
         
         if image_analysis:
@@ -144,51 +419,32 @@ class MedicalTriageAgent:
         {image_analysis}
         """
         
-        return {
-            **state,
-            "image_analysis": image_analysis,
-            "knowledge_context": knowledge_context,
-            "current_agent": "rag"
-        }
+        return knowledge_context
     
     @traceable(name="triage_agent")
-    def triage_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """Triage Agent - Analyzes symptoms and assigns risk score"""
+    async def triage_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """
+        Triage Agent - Assigns the final risk score
         
-        system_prompt = """You are an expert medical triage AI assistant. Analyze the patient's query and available medical knowledge to:
-
-1. Assess the urgency/risk level (0-10 scale):
-   - 0-3: Low risk (self-care appropriate)
-   - 4-6: Medium risk (monitor, may need doctor)
-   - 7-10: High risk (seek immediate medical attention)
-
-2. Provide your assessment in this format:
-   RISK_SCORE: [number 0-10]
-   REASONING: [your analysis]
-   
-Consider:
-- Severity of symptoms
-- Duration of symptoms
-- Combination of symptoms
-- Red flag symptoms (chest pain, difficulty breathing, severe bleeding, etc.)
-- Medical imaging findings (X-rays, CT scans, MRIs, etc.) if provided
-- Visual abnormalities or concerning features in medical images
-"""
+        The router's structured decision already carries a risk score, so
+        this only makes another LLM call when an image analysis is available
+        to weigh in; otherwise the router's assessment is kept as is.
+        """
+        
+        image_analysis = state.get("image_analysis")
+        if not image_analysis:
+            return {
+                "current_agent": "triage"
+            }
         
         query = state.get("query", "")
         knowledge_context = state.get("knowledge_context", "")
-        image_analysis = state.get("image_analysis")
         
-        # Build comprehensive context
+        # Build comprehensive context. Retrieved knowledge goes first and the
+        # patient query last so repeated retrievals share a cacheable prompt prefix
         context = f"""
-        Patient Query: {query}
-        
         Available Medical Knowledge:
         {knowledge_context}
-        """
-        
-        if image_analysis:
-            context += f"""
         
         IMPORTANT - Medical Image Analysis:
         {image_analysis}
@@ -196,97 +452,82 @@ Consider:
         Note: The image analysis should be weighted heavily in your risk assessment.
         """
         
+        context += f"""
+        Patient Query: {query}
+        """
+        
         messages = [
-            SystemMessage(content=system_prompt),
+            TRIAGE_SYSTEM_MESSAGE,
             HumanMessage(content=f"{context}\n\nProvide your risk assessment.")
         ]
         
-        response = self.llm.invoke(messages)
-        content = response.content
-        
-        # Extract risk score
-        risk_score = 5  # default
-        try:
-            for line in content.split("\n"):
-                if "RISK_SCORE:" in line:
-                    risk_score = int(line.split(":")[1].strip())
-                    break
-        except:
-            pass
-        
-        # Determine risk level
-        if risk_score <= 3:
-            risk_level = "low"
-        elif risk_score <= 6:
-            risk_level = "medium"
-        else:
-            risk_level = "high"
+        decision = await self._decide(messages)
         
         return {
-            **state,
-            "risk_score": risk_score,
-            "risk_level": risk_level,
+            "risk_score": decision.risk_score,
+            "risk_level": decision.risk_level,
+            "needs_clarification": decision.needs_clarification,
             "current_agent": "triage"
         }
     
-    @traceable(name="self_care_agent")
-    def self_care_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """Self-Care Agent - Provides advice for low-risk conditions"""
-        
-        system_prompt = """You are a compassionate medical advisor for low-risk health concerns. Provide:
-
-1. Clear explanation of the likely condition
-2. Self-care recommendations
-3. When to seek medical attention
-4. General wellness advice
-
-Be warm, supportive, and clear. Always include a disclaimer that this is not a substitute for professional medical advice."""
+    def _self_care_messages(self, state: MedicalTriageState) -> List[BaseMessage]:
+        """Build the Self-Care Agent prompt"""
         
         query = state.get("query", "")
         knowledge_context = state.get("knowledge_context", "")
         risk_score = state.get("risk_score", 5)
         
         messages = [
-            SystemMessage(content=system_prompt),
+            SELF_CARE_SYSTEM_MESSAGE,
+            *self._conversation(state),
             HumanMessage(content=f"""
-            Patient Query: {query}
-            Risk Score: {risk_score}/10
-            
             Medical Knowledge:
             {knowledge_context}
             
+            Patient Query: {query}
+            Risk Score: {risk_score}/10
+            
             Provide helpful self-care advice.
             """)
         ]
         
-        response = self.llm.invoke(messages)
+        return messages
+    
+    @traceable(name="self_care_agent")
+    async def self_care_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """Self-Care Agent - Provides advice for low-risk conditions"""
+        
+        response = await self.llm.ainvoke(self._self_care_messages(state))
         
         return {
-            **state,
             "recommendations": response.content,
             "needs_followup": False,
             "current_agent": "self_care"
         }
     
-    @traceable(name="clarification_agent")
-    def clarification_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """Clarification Agent - Asks follow-up questions for unclear cases"""
+    @staticmethod
+    def _conversation(state: MedicalTriageState) -> List[BaseMessage]:
+        """
+        Earlier conversation for the terminal agents
         
-        system_prompt = """You are a medical intake specialist. When information is insufficient, ask specific follow-up questions to better assess the situation.
-
-Ask about:
-- Duration and severity of symptoms
-- Associated symptoms
-- Medical history if relevant
-- Current medications
-- Recent activities or exposures
-
-Be concise and ask 2-3 most important questions."""
+        Only the responders see history; router, RAG and triage work from
+        the current query alone. The last message in state is the current
+        one, which the responder prompts already include.
+        """
+        conversation = list(state.get("messages", [])[:-1])
+        summary = state.get("history_summary")
+        if summary:
+            conversation.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        return conversation
+    
+    def _clarification_messages(self, state: MedicalTriageState) -> List[BaseMessage]:
+        """Build the Clarification Agent prompt"""
         
         query = state.get("query", "")
         
         messages = [
-            SystemMessage(content=system_prompt),
+            CLARIFICATION_SYSTEM_MESSAGE,
+            *self._conversation(state),
             HumanMessage(content=f"""
             Patient Query: {query}
             
@@ -294,32 +535,22 @@ Be concise and ask 2-3 most important questions."""
             """)
         ]
         
-        response = self.llm.invoke(messages)
+        return messages
+    
+    @traceable(name="clarification_agent")
+    async def clarification_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """Clarification Agent - Asks follow-up questions for unclear cases"""
+        
+        response = await self.llm.ainvoke(self._clarification_messages(state))
         
         return {
-            **state,
-            "recommendations": f"I need more information to help you better:\n\n{response.content}",
+            "recommendations": f"{CLARIFICATION_PREFIX}{response.content}",
             "needs_followup": True,
             "current_agent": "clarification"
         }
     
-    @traceable(name="doctor_referral_agent")
-    def doctor_referral_agent(self, state: MedicalTriageState) -> MedicalTriageState:
-        """Doctor Referral Agent - Handles medium/high risk cases"""
-        
-        system_prompt = """You are a medical triage specialist for cases requiring professional medical attention.
-
-For medium-risk cases:
-- Explain why medical consultation is recommended
-- Suggest timeline (within 24-48 hours)
-- Provide interim care advice
-
-For high-risk cases:
-- Strongly recommend immediate medical attention
-- List warning signs
-- Suggest going to ER/urgent care if applicable
-
-Always be clear but not alarmist."""
+    def _doctor_referral_messages(self, state: MedicalTriageState) -> List[BaseMessage]:
+        """Build the Doctor Referral Agent prompt"""
         
         query = state.get("query", "")
         knowledge_context = state.get("knowledge_context", "")
@@ -327,38 +558,64 @@ Always be clear but not alarmist."""
         risk_level = state.get("risk_level", "medium")
         
         messages = [
-            SystemMessage(content=system_prompt),
+            DOCTOR_REFERRAL_SYSTEM_MESSAGE,
+            *self._conversation(state),
             HumanMessage(content=f"""
-            Patient Query: {query}
-            Risk Score: {risk_score}/10 ({risk_level} risk)
-            
             Medical Knowledge:
             {knowledge_context}
             
+            Patient Query: {query}
+            Risk Score: {risk_score}/10 ({risk_level} risk)
+            
             Provide appropriate medical referral guidance.
             """)
         ]
         
-        response = self.llm.invoke(messages)
+        return messages
+    
+    @traceable(name="doctor_referral_agent")
+    async def doctor_referral_agent(self, state: MedicalTriageState) -> Dict[str, Any]:
+        """Doctor Referral Agent - Handles medium/high risk cases"""
+        
+        response = await self.llm.ainvoke(self._doctor_referral_messages(state))
         
         return {
-            **state,
             "recommendations": response.content,
             "needs_followup": False,
             "current_agent": "doctor_referral"
         }
     
     def route_after_router(self, state: MedicalTriageState) -> str:
-        """Route after router agent"""
-        if state.get("is_relevant", False):
-            return "rag"
-        else:
+        """
+        Route after router agent
+        
+        Retrieval cannot change the outcome at either end of the risk
+        scale, so text-only queries skip RAG and triage when the router
+        finds them low risk with no need for reference material, or an
+        unambiguous high-risk emergency. Image queries always go through
+        triage, which weighs the image analysis.
+        """
+        if not state.get("is_relevant", False):
             return "reject"
+        
+        if not state.get("image_data"):
+            risk_level = state.get("risk_level", "medium")
+            if state.get("emergency", False) and risk_level == "high":
+                return "skip_rag_emergency"
+            if (not state.get("retrieval_needed", True) and risk_level == "low"
+                    and not state.get("needs_clarification", False)):
+                return "skip_rag_low"
+        
+        return "rag"
     
     def route_after_triage(self, state: MedicalTriageState) -> str:
         """Route after triage agent based on risk level"""
         risk_level = state.get("risk_level", "medium")
         
+        # High-risk cases always get a referral, even if details are missing
+        if state.get("needs_clarification", False) and risk_level != "high":
+            return "clarification"
+        
         if risk_level == "low":
             return "self_care"
         elif risk_level in ["medium", "high"]:
@@ -366,8 +623,14 @@ Always be clear but not alarmist."""
         else:
             return "clarification"
     
-    def _build_graph(self) -> StateGraph:
-        """Build the LangGraph workflow"""
+    def _build_graph(self, include_responders: bool = True) -> StateGraph:
+        """
+        Build the LangGraph workflow
+        
+        Args:
+            include_responders: Whether to add the terminal agents after triage.
+                Without them the graph ends once the risk level is known.
+        """
         
         workflow = StateGraph(MedicalTriageState)
         
@@ -375,15 +638,11 @@ Always be clear but not alarmist."""
         workflow.add_node("router", self.router_agent)
         workflow.add_node("rag", self.rag_agent)
         workflow.add_node("triage", self.triage_agent)
-        workflow.add_node("self_care", self.self_care_agent)
-        workflow.add_node("clarification", self.clarification_agent)
-        workflow.add_node("doctor_referral", self.doctor_referral_agent)
         
         # Add reject node
-        def reject_node(state: MedicalTriageState) -> MedicalTriageState:
+        async def reject_node(state: MedicalTriageState) -> Dict[str, Any]:
             return {
-                **state,
-                "recommendations": "I apologize, but I can only help with health and medical-related questions. Please ask a medical question, and I'll be happy to assist you.",
+                "recommendations": REJECT_MESSAGE,
                 "current_agent": "reject"
             }
         
@@ -392,18 +651,40 @@ Always be clear but not alarmist."""
         # Set entry point
         workflow.set_entry_point("router")
         
-        # Add conditional edges
+        # RAG always goes to triage
+        workflow.add_edge("rag", "triage")
+        workflow.add_edge("reject", END)
+        
+        if not include_responders:
+            workflow.add_conditional_edges(
+                "router",
+                self.route_after_router,
+                {
+                    "rag": "rag",
+                    "reject": "reject",
+                    "skip_rag_low": END,
+                    "skip_rag_emergency": END
+                }
+            )
+            workflow.add_edge("triage", END)
+            return workflow.compile()
+        
+        # Add conditional edges. Skipped queries already have a final
+        # risk level, so they go straight to their responder
         workflow.add_conditional_edges(
             "router",
             self.route_after_router,
             {
                 "rag": "rag",
-                "reject": "reject"
+                "reject": "reject",
+                "skip_rag_low": "self_care",
+                "skip_rag_emergency": "doctor_referral"
             }
         )
         
-        # RAG always goes to triage
-        workflow.add_edge("rag", "triage")
+        workflow.add_node("self_care", self.self_care_agent)
+        workflow.add_node("clarification", self.clarification_agent)
+        workflow.add_node("doctor_referral", self.doctor_referral_agent)
         
         # Triage routes based on risk
         workflow.add_conditional_edges(
@@ -420,13 +701,12 @@ Always be clear but not alarmist."""
         workflow.add_edge("self_care", END)
         workflow.add_edge("doctor_referral", END)
         workflow.add_edge("clarification", END)
-        workflow.add_edge("reject", END)
         
         return workflow.compile()
     
-    @traceable(name="process_message")
-    def process_message(self, message: str, history: List[Dict[str, str]] = None, image: str = None) -> str:
-        """Process a user message through the medical triage workflow"""
+    async def _initial_state(self, message: str, history: List[Dict[str, str]] = None, image: str = None) -> MedicalTriageState:
+        """Build the graph input state for a user message"""
+        settings = get_settings()
         
         # Convert history to LangChain messages
         messages = []
@@ -439,6 +719,15 @@ Always be clear but not alarmist."""
                 elif role == "assistant" or role == "bot":
                     messages.append(AIMessage(content=content))
         
+        # Keep between one and two windows of recent messages verbatim. The
+        # cut point moves one whole window at a time, so the summary of the
+        # older messages only changes (and costs an LLM call) every
+        # settings.history_turns turns
+        window = 2 * settings.history_turns
+        cut = max(0, (len(messages) - window) // window * window)
+        history_summary = await self._summarize_history(messages[:cut]) if cut else ""
+        messages = messages[cut:]
+        
         # Add current message
         if image:
             message_with_image = f"{message}\n\n[Medical image attached for analysis]"
@@ -446,23 +735,168 @@ Always be clear but not alarmist."""
         else:
             messages.append(HumanMessage(content=message))
         
-        # Initialize state
-        initial_state: MedicalTriageState = {
+        return {
             "messages": messages,
+            "history_summary": history_summary,
             "query": message,
             "image_data": image,  # Pass image data to state
             "image_analysis": None,
+            "retrieval_results": None,
             "is_relevant": False,
             "knowledge_context": "",
+            "full_knowledge_context": "",
             "risk_score": 0,
             "risk_level": "low",
+            "needs_clarification": False,
+            "retrieval_needed": True,
+            "emergency": False,
             "recommendations": "",
             "needs_followup": False,
             "current_agent": ""
         }
+    
+    async def _summarize_history(self, messages: List[BaseMessage]) -> str:
+        """
+        Rolling summary of old history messages
+        
+        The last window of messages is folded into the (cached) summary of
+        everything before it, so each call sends one window plus a short
+        summary rather than the whole history.
+        """
+        settings = get_settings()
+        digest = hashlib.blake2b(digest_size=16)
+        for m in messages:
+            digest.update(f"{m.type}:{m.content}\0".encode())
+        key = digest.digest()
+        cached = self._summary_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        window = 2 * settings.history_turns
+        previous = await self._summarize_history(messages[:-window]) if len(messages) > window else ""
+        block = "\n".join(
+            f"{'Patient' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+            for m in messages[-window:]
+        )
+        response = await self.summary_llm.ainvoke([
+            HISTORY_SUMMARY_SYSTEM_MESSAGE,
+            HumanMessage(content=f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{block}")
+        ])
+        self._summary_cache[key] = response.content
+        return response.content
+    
+    @staticmethod
+    def _cache_namespace(history: List[Dict[str, str]] = None, image: str = None) -> str:
+        """Hash of the attached image and previous turn, so cached answers never cross images or conversations"""
+        namespace = hashlib.blake2b(digest_size=16)
+        if image:
+            namespace.update(hashlib.sha256(image.encode()).digest())
+        if history:
+            last = history[-1]
+            namespace.update(f"{last.get('role', '')}:{last.get('content', '')}".encode())
+        return namespace.hexdigest()
+    
+    async def _lookup_cache(
+        self, message: str, history: List[Dict[str, str]] = None, image: str = None
+    ) -> Tuple[Optional[str], Tuple[bytes, List[float], str]]:
+        """
+        Look a message up in the exact cache, then in the semantic cache
+        
+        Returns:
+            Tuple of (cached response or None, cache keys for _store_cache).
+            The keys are the exact-match digest, the normalized query
+            embedding (None on an exact hit) and the namespace.
+        """
+        normalized = " ".join(message.lower().split())
+        namespace = self._cache_namespace(history, image)
+        exact_key = hashlib.blake2b(f"{normalized}\0{namespace}".encode(), digest_size=16).digest()
+        
+        cached = self.exact_cache.get(exact_key)
+        if cached is not None:
+            return cached, (exact_key, None, namespace)
+        
+        embedding = await self.rag_service.embeddings.aembed_query(normalized)
+        cached = self.response_cache.lookup(embedding, namespace)
+        if cached is not None:
+            self.exact_cache[exact_key] = cached
+        return cached, (exact_key, embedding, namespace)
+    
+    def _store_cache(self, cache_keys: Tuple[bytes, List[float], str], response: str):
+        """Insert a fresh response into both cache tiers"""
+        exact_key, embedding, namespace = cache_keys
+        self.exact_cache[exact_key] = response
+        self.response_cache.insert(embedding, response, namespace)
+    
+    @traceable(name="process_message")
+    async def process_message(
+        self,
+        message: str,
+        history: List[Dict[str, str]] = None,
+        image: str = None,
+        no_cache: bool = False
+    ) -> str:
+        """
+        Process a user message through the medical triage workflow
+        
+        Args:
+            message: The user's message
+            history: Previous chat turns
+            image: Optional base64 image or data URL
+            no_cache: Bypass the response cache (e.g. for high-risk follow-ups)
+        """
+        cache_keys = None
+        if self.response_cache is not None and not no_cache:
+            cached, cache_keys = await self._lookup_cache(message, history, image)
+            if cached is not None:
+                return cached
         
         # Run the graph
-        result = self.graph.invoke(initial_state)
+        result = await self.graph.ainvoke(await self._initial_state(message, history, image))
         
         # Return the final recommendations
-        return result.get("recommendations", "I apologize, but I encountered an error processing your request.")
+        response = result.get("recommendations", "I apologize, but I encountered an error processing your request.")
+        if cache_keys is not None and result.get("recommendations"):
+            self._store_cache(cache_keys, response)
+        return response
+    
+    @traceable(name="stream_message")
+    async def stream_message(
+        self,
+        message: str,
+        history: List[Dict[str, str]] = None,
+        image: str = None,
+        no_cache: bool = False
+    ) -> AsyncIterator[str]:
+        """
+        Process a user message and stream the final response
+        
+        Router, RAG and triage run to completion first; only the terminal
+        agent's answer is streamed, token by token, as it is generated.
+        A cached answer is yielded as a single chunk.
+        """
+        cache_keys = None
+        if self.response_cache is not None and not no_cache:
+            cached, cache_keys = await self._lookup_cache(message, history, image)
+            if cached is not None:
+                yield cached
+                return
+        
+        state = await self.assessment_graph.ainvoke(await self._initial_state(message, history, image))
+        
+        if not state.get("is_relevant", False):
+            tokens = [REJECT_MESSAGE]
+            yield REJECT_MESSAGE
+        else:
+            route = self.route_after_triage(state)
+            tokens = []
+            if route == "clarification":
+                tokens.append(CLARIFICATION_PREFIX)
+                yield CLARIFICATION_PREFIX
+            
+            async for chunk in self.llm.astream(self._responder_messages[route](state)):
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield chunk.content
+        
+        if cache_keys is not None:
+            self._store_cache(cache_keys, "".join(tokens))
@@ -0,0 +1,4 @@
+"""Cache service initialization"""
+from .semantic_cache import SemanticCache
+
+__all__ = ['SemanticCache']
@@ -0,0 +1,120 @@
+"""
+Semantic Response Cache
+
+Caches responses keyed by query embedding. Candidate lookup uses
+random-projection LSH so a hit costs a few bucket probes plus an exact
+cosine check instead of a full LLM pipeline run.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+class SemanticCache:
+    """In-process semantic cache using random-projection LSH"""
+    
+    def __init__(
+        self,
+        num_bits: int = 8,
+        num_tables: int = 16,
+        threshold: float = 0.95,
+        max_entries: int = 10000,
+        ttl: Optional[float] = None,
+        seed: int = 0
+    ):
+        self.num_bits = num_bits
+        self.num_tables = num_tables
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._rng = np.random.default_rng(seed)
+        
+        # Hyperplanes are created lazily once the embedding size is known
+        self._planes: Optional[np.ndarray] = None
+        self._powers = 1 << np.arange(num_bits)
+        
+        # entry_id -> (unit vector, value, bucket keys, expiry time or None)
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any, List[Tuple], Optional[float]]]" = OrderedDict()
+        self._buckets: Dict[Tuple, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        """Convert an embedding to a unit float32 vector"""
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+    
+    def _bucket_keys(self, namespace: str, vec: np.ndarray) -> List[Tuple]:
+        """Hash a vector into one bucket key per LSH table"""
+        if self._planes is None:
+            self._planes = self._rng.standard_normal(
+                (self.num_tables, self.num_bits, vec.shape[0])
+            ).astype(np.float32)
+        
+        bits = (self._planes @ vec) > 0
+        codes = bits.astype(np.int64) @ self._powers
+        return [(namespace, table, int(code)) for table, code in enumerate(codes)]
+    
+    def lookup(self, embedding: List[float], namespace: str = "") -> Optional[Any]:
+        """Return the cached value for the closest stored query above the threshold"""
+        vec = self._normalize(embedding)
+        
+        with self._lock:
+            candidates = set()
+            for key in self._bucket_keys(namespace, vec):
+                candidates.update(self._buckets.get(key, ()))
+            
+            now = time.monotonic()
+            best_id, best_score = None, self.threshold
+            for entry_id in candidates:
+                expires_at = self._entries[entry_id][3]
+                if expires_at is not None and expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(self._entries[entry_id][0] @ vec)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            
+            if best_id is None:
+                return None
+            
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][1]
+    
+    def insert(self, embedding: List[float], value: Any, namespace: str = "") -> None:
+        """Store a value under a query embedding"""
+        vec = self._normalize(embedding)
+        
+        with self._lock:
+            keys = self._bucket_keys(namespace, vec)
+            entry_id = self._next_id
+            self._next_id += 1
+            
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[entry_id] = (vec, value, keys, expires_at)
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            
+            # Evict least recently used entries
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def _remove(self, entry_id: int) -> None:
+        """Drop an entry and its bucket references; caller holds the lock"""
+        _, _, keys, _ = self._entries.pop(entry_id)
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+    
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
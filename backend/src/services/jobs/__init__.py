@@ -0,0 +1,4 @@
+"""Background job service initialization"""
+from .ingest_worker import IngestWorker
+
+__all__ = ['IngestWorker']
@@ -0,0 +1,99 @@
+"""
+Background Ingestion Worker
+
+Runs multimodal ingestion jobs (image decode, vision analysis, embedding
+and vector store writes) on a dedicated thread pool so the API can hand
+back a job ID immediately instead of holding the request open.
+"""
+
+import asyncio
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class IngestWorker:
+    """Thread pool for ingestion jobs with a bounded registry of job results"""
+    
+    def __init__(self, max_workers: int = 4, max_jobs: int = 1000):
+        """
+        Args:
+            max_workers: Number of jobs processed concurrently
+            max_jobs: Number of jobs kept for status lookups
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> str:
+        """
+        Queue an ingestion job
+        
+        Args:
+            fn: Callable returning an ingestion result dict with a "success" key
+        
+        Returns:
+            Job ID to pass to status() or wait()
+        """
+        job_id = uuid.uuid4().hex
+        future = self.executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._jobs[job_id] = future
+            # Forget the oldest finished jobs once the registry is full
+            for old_id in list(self._jobs):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if self._jobs[old_id].done():
+                    del self._jobs[old_id]
+        return job_id
+    
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job, or None if it is unknown"""
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return None
+        
+        job = {"job_id": job_id, "status": "pending", "result": None, "error": None}
+        if future.running():
+            job["status"] = "running"
+        elif future.done():
+            error = future.exception()
+            result = None if error else future.result()
+            if error is None and result.get("success"):
+                job["status"] = "completed"
+            else:
+                job["status"] = "failed"
+                job["error"] = str(error) if error else result.get("error", "Unknown error")
+            job["result"] = result
+        return job
+    
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait until the job finishes or the timeout expires
+        
+        The job's future is awaited directly, so no thread is held while
+        waiting. It is shielded, so a timeout does not cancel the job.
+        
+        Returns:
+            The job snapshot (still pending/running if the timeout expired)
+        """
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return None
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            # A failed job is reported through the snapshot
+            pass
+        return self.status(job_id)
+    
+    def shutdown(self):
+        """Stop accepting jobs and wait for running ones to finish"""
+        self.executor.shutdown(wait=True)
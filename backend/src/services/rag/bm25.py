@@ -0,0 +1,99 @@
+"""
+BM25 Sparse Index
+
+In-memory Okapi BM25 over the ingested chunks, used as the lexical leg of
+hybrid search. Drug names, ICD codes and abbreviations that dense
+embeddings blur are matched exactly here.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into alphanumeric terms"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incrementally built Okapi BM25 index
+    
+    Documents are stored as per-term postings, so adding chunks is O(terms)
+    and a search only scores documents that share a term with the query.
+    Chunk IDs are content hashes; adding an ID twice is a no-op.
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents: List[Document] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._seen_ids = set()
+        # Term -> {document position: term frequency}
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._documents)
+    
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Index chunks that are not indexed yet"""
+        with self._lock:
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                if chunk_id in self._seen_ids:
+                    continue
+                self._seen_ids.add(chunk_id)
+                
+                terms = tokenize(document)
+                position = len(self._documents)
+                self._documents.append(Document(page_content=document, metadata=metadata or {}))
+                self._lengths.append(len(terms))
+                self._total_length += len(terms)
+                for term, count in Counter(terms).items():
+                    self._postings[term][position] = count
+    
+    def search(self, query: str, k: int = 4, where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        """
+        Rank indexed chunks against a query
+        
+        Args:
+            query: Search query
+            k: Number of results to return
+            where: Only score chunks whose metadata has all of these values
+        
+        Returns:
+            Up to k (document, BM25 score) pairs, best first
+        """
+        with self._lock:
+            num_documents = len(self._documents)
+            if not num_documents:
+                return []
+            average_length = self._total_length / num_documents or 1.0
+            
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log((num_documents - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+                for position, frequency in postings.items():
+                    if where and not self._matches(position, where):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / average_length)
+                    scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._documents[position], score) for position, score in best]
+    
+    def _matches(self, position: int, where: Dict[str, Any]) -> bool:
+        metadata = self._documents[position].metadata
+        return all(metadata.get(key) == value for key, value in where.items())
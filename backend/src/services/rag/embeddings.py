@@ -0,0 +1,168 @@
+"""
+Local Embedding Models
+
+Embedding backends that run in-process instead of calling the OpenAI API.
+"""
+
+import os
+from pathlib import Path
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class LateChunkingEmbeddings(Embeddings):
+    """
+    Long-context sentence-transformers embeddings with late chunking
+    
+    embed_chunks encodes a whole document in one forward pass and
+    mean-pools the token embeddings that fall inside each chunk, so a
+    document split into N chunks costs one pass instead of N and every
+    chunk vector carries the surrounding document context.
+    """
+    
+    def __init__(self, model_name: str):
+        # Imported lazily so the default OpenAI backend never loads torch
+        from sentence_transformers import SentenceTransformer
+        
+        self.model = SentenceTransformer(model_name, trust_remote_code=True)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts independently"""
+        return self.model.encode(texts, normalize_embeddings=True).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query"""
+        return self.embed_documents([text])[0]
+    
+    def embed_chunks(self, document: str, chunks: List[str]) -> List[List[float]]:
+        """
+        Embed chunks of a document with a single pass over the full document
+        
+        Args:
+            document: The full document text
+            chunks: Substrings of the document, in order (may overlap)
+            
+        Returns:
+            One embedding per chunk
+        """
+        if not chunks:
+            return []
+        
+        token_embeddings = self.model.encode(document, output_value="token_embeddings")
+        token_embeddings = np.asarray(token_embeddings.cpu() if hasattr(token_embeddings, "cpu") else token_embeddings)
+        offsets = self.model.tokenizer(
+            document,
+            return_offsets_mapping=True,
+            truncation=True,
+            max_length=self.model.max_seq_length
+        )["offset_mapping"][:len(token_embeddings)]
+        token_starts = np.array([start for start, _ in offsets])
+        token_ends = np.array([end for _, end in offsets])
+        is_content = token_ends > token_starts  # special tokens map to (0, 0)
+        
+        embeddings = []
+        missing = []
+        cursor = 0
+        for i, chunk in enumerate(chunks):
+            start = document.find(chunk, cursor)
+            if start == -1:
+                missing.append(i)
+                embeddings.append(None)
+                continue
+            end = start + len(chunk)
+            cursor = start + 1
+            
+            mask = is_content & (token_starts < end) & (token_ends > start)
+            if not mask.any():
+                # Chunk lies past the model's context window
+                missing.append(i)
+                embeddings.append(None)
+                continue
+            
+            pooled = token_embeddings[mask].mean(axis=0)
+            embeddings.append((pooled / np.linalg.norm(pooled)).tolist())
+        
+        # Fall back to independent encoding for chunks that could not be mapped
+        if missing:
+            for i, vector in zip(missing, self.embed_documents([chunks[i] for i in missing])):
+                embeddings[i] = vector
+        
+        return embeddings
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    bge-style embeddings served by onnxruntime on the CPU
+    
+    Expects a directory with tokenizer.json and an ONNX export of the model
+    (e.g. `optimum-cli export onnx --model BAAI/bge-small-en-v1.5 <dir>`).
+    If the int8 file is missing it is built once from model.onnx with
+    dynamic quantization. Vectors are the normalized CLS embedding.
+    """
+    
+    # bge v1.5 recommends this instruction for short retrieval queries
+    QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+    
+    def __init__(self, model_dir: str, model_file: str = "model_int8.onnx", batch_size: int = 32, max_length: int = 512):
+        # Imported lazily so the default OpenAI backend never loads onnxruntime
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        model_path = Path(model_dir) / model_file
+        if not model_path.exists():
+            quantize_onnx_model(Path(model_dir) / "model.onnx", model_path)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        
+        self.tokenizer = Tokenizer.from_file(str(Path(model_dir) / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Run the model over texts and return normalized CLS vectors"""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+            vectors.append(hidden[:, 0])
+        
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        vectors = np.concatenate(vectors)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed document chunks"""
+        return self._encode(texts).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query with the bge retrieval instruction"""
+        return self._encode([self.QUERY_INSTRUCTION + text])[0].tolist()
+
+
+def quantize_onnx_model(source: Path, target: Path) -> None:
+    """
+    Write a dynamically int8-quantized copy of an ONNX model
+    
+    Args:
+        source: Path of the float ONNX model
+        target: Path to write the quantized model to
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    if not Path(source).exists():
+        raise FileNotFoundError(f"No ONNX model at {source}; export one with optimum-cli first")
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
@@ -1,21 +1,102 @@
 import os
-from typing import List, Dict, Any, Optional
+import json
+import logging
+import asyncio
+import hashlib
+import pickle
+import sqlite3
+import string
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Iterator
 import chromadb
+import faiss
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 import networkx as nx
-from src.core.config import settings
-from src.services.vision.image_processor import image_processor
+from src.core.base import BaseVectorStore
+from src.core.config import get_settings
+from src.core.http import get_http_client, get_async_http_client
+from src.core.tokens import count_tokens
+from src.services.rag.bm25 import BM25Index
+from src.services.rag.embeddings import LateChunkingEmbeddings, LocalEmbeddings
+from src.services.vision.image_processor import get_image_processor
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+def hnsw_metadata() -> Dict[str, Any]:
+    """
+    Collection metadata for new Chroma collections
+    
+    A small search_ef keeps k=4 lookups fast; recall at that k stays close
+    to the default of 100
+    """
+    settings = get_settings()
+    return {
+        "hnsw:space": settings.chroma_hnsw_space,
+        "hnsw:construction_ef": settings.chroma_hnsw_construction_ef,
+        "hnsw:M": settings.chroma_hnsw_m,
+        "hnsw:search_ef": settings.chroma_hnsw_search_ef,
+    }
+
+# Reciprocal Rank Fusion constant: score(doc) = sum of 1 / (RRF_K + rank)
+RRF_K = 60
+
+# Returned by MedicalKnowledgeGraph.query_graph when nothing matches
+NO_GRAPH_RESULTS = "No relationships found."
+
+# Bump when _initialize_medical_knowledge or MedicalKnowledgeGraph state changes so stale kg.pkl snapshots are rebuilt
+KNOWLEDGE_GRAPH_VERSION = 3
+
+@lru_cache
+def _text_splitter() -> RecursiveCharacterTextSplitter:
+    """Stateless, so one splitter is shared by every service instance"""
+    settings = get_settings()
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.chunk_size,
+        chunk_overlap=settings.chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
 
 class MedicalKnowledgeGraph:
     """Knowledge Graph for storing medical entities and relationships"""
     
     def __init__(self):
         self.graph = nx.DiGraph()
+        # Aho-Corasick automaton over lowercased entity names, built on first query
+        self._automaton = None
+        # Lowercased name token -> entities containing it, for partial matches
+        self._token_index: Dict[str, Set[str]] = defaultdict(set)
+        # Entity -> first three successors, as listed in query results
+        self._top_neighbors: Dict[str, List[str]] = {}
+        # Frozen CSR copy of the forward edges for traversal: node i's
+        # successors are _indices[_indptr[i]:_indptr[i + 1]]. Built on first
+        # lookup and reset (with _distances) whenever the graph changes
+        self._names: List[str] = []
+        self._name_to_id: Dict[str, int] = {}
+        self._types: List[str] = []
+        self._indptr: Optional[np.ndarray] = None
+        self._indices: Optional[np.ndarray] = None
+        # Source -> {target: hops} for every pair within DISTANCE_CUTOFF hops
+        self._distances: Optional[Dict[str, Dict[str, int]]] = None
         
+    # Hop limit of the precomputed distances; deeper lookups run a BFS
+    DISTANCE_CUTOFF = 2
+    
     def add_entity(self, entity: str, entity_type: str, metadata: Dict = None):
         """Add a medical entity to the graph"""
         self.graph.add_node(
@@ -23,91 +104,264 @@ class MedicalKnowledgeGraph:
             entity_type=entity_type,
             metadata=metadata or {}
         )
+        self._automaton = None
+        self._indptr = None
+        self._distances = None
+        for token in self._tokenize(entity):
+            self._token_index[token].add(entity)
     
     def add_relationship(self, source: str, target: str, relation: str, metadata: Dict = None):
         """Add a relationship between entities"""
+        is_new_neighbor = not self.graph.has_edge(source, target)
         self.graph.add_edge(
             source,
             target,
             relation=relation,
             metadata=metadata or {}
         )
+        self._indptr = None
+        self._distances = None
+        
+        neighbors = self._top_neighbors.setdefault(source, [])
+        if is_new_neighbor and len(neighbors) < 3:
+            neighbors.append(target)
     
     def get_related_entities(self, entity: str, max_hops: int = 2) -> List[Dict]:
         """Get related entities within max_hops"""
         if entity not in self.graph:
             return []
         
-        related = []
-        for target in nx.single_source_shortest_path_length(self.graph, entity, cutoff=max_hops):
-            if target != entity:
-                path_length = nx.shortest_path_length(self.graph, entity, target)
-                related.append({
-                    'entity': target,
-                    'distance': path_length,
-                    'type': self.graph.nodes[target].get('entity_type', 'unknown')
-                })
+        if self._indptr is None:
+            self._freeze()
         
-        return related
+        source = self._name_to_id[entity]
+        if max_hops <= self.DISTANCE_CUTOFF:
+            if self._distances is None:
+                self._distances = {
+                    self._names[i]: self._bfs(i, self.DISTANCE_CUTOFF) for i in range(len(self._names))
+                }
+            distances = self._distances[entity]
+        else:
+            distances = self._bfs(source, max_hops)
+        
+        return [
+            {
+                'entity': target,
+                'distance': distance,
+                'type': self._types[self._name_to_id[target]]
+            }
+            for target, distance in distances.items()
+            if distance <= max_hops
+        ]
     
-    def query_graph(self, query: str) -> str:
-        """Query the knowledge graph"""
-        keywords = query.lower().split()
-        relevant_nodes = []
+    def _freeze(self):
+        """Snapshot the graph into CSR arrays so traversals avoid NetworkX"""
+        self._names = list(self.graph.nodes)
+        self._name_to_id = {name: i for i, name in enumerate(self._names)}
+        self._types = [self.graph.nodes[name].get('entity_type', 'unknown') for name in self._names]
+        
+        degrees = [self.graph.out_degree(name) for name in self._names]
+        self._indptr = np.zeros(len(self._names) + 1, dtype=np.int32)
+        np.cumsum(degrees, out=self._indptr[1:])
+        self._indices = np.fromiter(
+            (self._name_to_id[target] for name in self._names for target in self.graph.successors(name)),
+            dtype=np.int32,
+            count=int(self._indptr[-1])
+        )
+    
+    def _bfs(self, source: int, max_hops: int) -> Dict[str, int]:
+        """Hop distance from source to every other node within max_hops, by level-synchronous BFS"""
+        visited = np.zeros(len(self._names), dtype=bool)
+        visited[source] = True
+        frontier = np.array([source], dtype=np.int32)
         
+        distances = {}
+        for hop in range(1, max_hops + 1):
+            if not frontier.size:
+                break
+            neighbors = np.concatenate([self._indices[self._indptr[f]:self._indptr[f + 1]] for f in frontier])
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+            for i in frontier:
+                distances[self._names[i]] = hop
+        
+        return distances
+    
+    def __getstate__(self):
+        # The automaton, CSR arrays and distances are cheap to rebuild on first query; don't persist them
+        state = self.__dict__.copy()
+        state["_automaton"] = None
+        state["_indptr"] = None
+        state["_distances"] = None
+        return state
+    
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        """Split text into lowercased tokens with surrounding punctuation removed"""
+        tokens = (token.strip(string.punctuation) for token in text.lower().split())
+        return [token for token in tokens if token]
+    
+    def _build_automaton(self):
+        """Compile all entity names into a single Aho-Corasick automaton"""
+        automaton = ahocorasick.Automaton()
         for node in self.graph.nodes():
-            node_lower = node.lower()
-            if any(keyword in node_lower for keyword in keywords):
-                relevant_nodes.append(node)
+            automaton.add_word(node.lower(), node)
+        automaton.make_automaton()
+        return automaton
+    
+    def match_entities(self, query: str) -> List[str]:
+        """
+        Find entity names that occur as whole words in the query
+        
+        One linear pass over the query regardless of the number of
+        entities. Returns an empty list if pyahocorasick is not installed.
+        """
+        if ahocorasick is None or self.graph.number_of_nodes() == 0:
+            return []
+        
+        if self._automaton is None:
+            self._automaton = self._build_automaton()
+        
+        text = query.lower()
+        matches = []
+        for end, node in self._automaton.iter(text):
+            start = end - len(node) + 1
+            # Only accept matches on word boundaries ("flu" must not match "influenza")
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end + 1 < len(text) and text[end + 1].isalnum():
+                continue
+            if node not in matches:
+                matches.append(node)
+        return matches
+    
+    def query_graph(self, query: str) -> str:
+        """
+        Query the knowledge graph
+        
+        Whole entity names found in the query come first, followed by
+        entities sharing a word with the query ("chest" -> "chest pain").
+        Both lookups are dict/automaton hits with no graph traversal.
+        """
+        relevant_nodes = self.match_entities(query)
+        
+        seen = set(relevant_nodes)
+        for token in self._tokenize(query):
+            for node in sorted(self._token_index.get(token, ())):
+                if node not in seen:
+                    seen.add(node)
+                    relevant_nodes.append(node)
         
         if not relevant_nodes:
             return "No relevant information found in knowledge graph."
         
         result = []
         for node in relevant_nodes[:5]:
-            neighbors = list(self.graph.neighbors(node))
+            neighbors = self._top_neighbors.get(node)
             if neighbors:
                 result.append(f"{node}: related to {', '.join(neighbors[:3])}")
         
-        return "\n".join(result) if result else "No relationships found."
+        return "\n".join(result) if result else NO_GRAPH_RESULTS
 
 
-class ChromaRAGService:
+class ChromaRAGService(BaseVectorStore):
     """RAG Service with ChromaDB vector store and Knowledge Graph"""
     
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            model=settings.embedding_model,
-            openai_api_key=settings.openai_api_key
-        )
-        
-        # Initialize ChromaDB
-        self.chroma_client = chromadb.Client(
-            ChromaSettings(
-                persist_directory=settings.chroma_persist_directory,
-                anonymized_telemetry=False
+        settings = get_settings()
+        if settings.embedding_backend == "late_chunking":
+            self.embeddings = LateChunkingEmbeddings(settings.late_chunking_model)
+        elif settings.embedding_backend == "local":
+            self.embeddings = LocalEmbeddings(settings.local_embedding_model_dir, settings.local_embedding_model_file)
+        else:
+            self.embeddings = OpenAIEmbeddings(
+                model=settings.embedding_model,
+                openai_api_key=settings.openai_api_key,
+                chunk_size=settings.embedding_batch_size,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
+        
+        self._init_vector_store()
+        
+        # Lexical index over the same chunks, rebuilt from the store on startup
+        self.sparse_index = BM25Index()
+        for ids, documents, metadatas in self._stored_chunks():
+            self.sparse_index.add(ids, documents, metadatas)
+        
+        # Initialize Knowledge Graph
+        self.knowledge_graph = self._load_knowledge_graph()
+    
+    def _init_vector_store(self):
+        """Open the ChromaDB client and collection"""
+        settings = get_settings()
+        # chromadb.Client() is in-memory even with a persist_directory setting
+        self.chroma_client = chromadb.PersistentClient(
+            path=settings.chroma_persist_directory,
+            settings=ChromaSettings(anonymized_telemetry=False)
         )
         
-        # Initialize vector store
         self.vectorstore = Chroma(
             client=self.chroma_client,
             collection_name=settings.collection_name,
             embedding_function=self.embeddings,
-            persist_directory=settings.chroma_persist_directory
+            persist_directory=settings.chroma_persist_directory,
+            collection_metadata=hnsw_metadata()
         )
+        self._sync_hnsw_config()
+    
+    def _sync_hnsw_config(self):
+        """
+        Apply settings.chroma_hnsw_search_ef to an existing collection
+        
+        Chroma ignores the metadata of collections that already exist.
+        ef_search can be changed in place; space, M and construction_ef
+        need a rebuild with migrate_chroma_hnsw.py.
+        """
+        settings = get_settings()
+        collection = self.vectorstore._collection
+        hnsw = (collection.configuration or {}).get("hnsw") or {}
+        if hnsw.get("ef_search") != settings.chroma_hnsw_search_ef:
+            collection.modify(configuration={"hnsw": {"ef_search": settings.chroma_hnsw_search_ef}})
+        
+        expected = {
+            "space": settings.chroma_hnsw_space,
+            "ef_construction": settings.chroma_hnsw_construction_ef,
+            "max_neighbors": settings.chroma_hnsw_m,
+        }
+        if any(hnsw.get(key) != value for key, value in expected.items()):
+            logger.warning(
+                f"Collection {collection.name} was built with different HNSW parameters; "
+                "run migrate_chroma_hnsw.py to rebuild it"
+            )
+    
+    def _load_knowledge_graph(self) -> MedicalKnowledgeGraph:
+        """
+        Load the knowledge graph snapshot, building and saving it on first run
+        
+        The snapshot lives next to the Chroma data as kg.pkl and is rebuilt
+        whenever KNOWLEDGE_GRAPH_VERSION changes.
+        """
+        settings = get_settings()
+        path = Path(settings.chroma_persist_directory) / "kg.pkl"
+        try:
+            with open(path, "rb") as f:
+                version, knowledge_graph = pickle.load(f)
+            if version == KNOWLEDGE_GRAPH_VERSION:
+                return knowledge_graph
+        except (OSError, EOFError, ValueError, AttributeError, pickle.UnpicklingError):
+            pass
         
-        # Initialize Knowledge Graph
         self.knowledge_graph = MedicalKnowledgeGraph()
         self._initialize_medical_knowledge()
         
-        # Text splitter for chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # Write atomically so concurrent workers never read a partial snapshot
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump((KNOWLEDGE_GRAPH_VERSION, self.knowledge_graph), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.knowledge_graph
     
     def _initialize_medical_knowledge(self):
         """Initialize the knowledge graph with medical domain knowledge"""
@@ -168,32 +422,191 @@ class ChromaRAGService:
     
     def ingest_text(self, text: str, source: str = "user") -> int:
         """Ingest text into the vector store"""
-        chunks = self.text_splitter.split_text(text)
-        documents = [
-            Document(
-                page_content=chunk,
-                metadata={"source": source, "chunk_id": i}
+        return self.ingest_texts([text], [source])
+    
+    def ingest_texts(self, texts: List[str], sources: List[str]) -> int:
+        """
+        Ingest several texts into the vector store with batched writes
+        
+        All texts are split first and the combined chunk list is written
+        through _add_chunks, so the whole call costs a handful of embedding
+        requests and collection writes instead of one per text. With the
+        late chunking backend each text is encoded once and its chunk
+        vectors are pooled from that single pass.
+        
+        Args:
+            texts: Text contents to ingest
+            sources: Source identifier for each text
+            
+        Returns:
+            Number of chunks newly added; chunks already stored are not counted
+        """
+        late_chunking = isinstance(self.embeddings, LateChunkingEmbeddings)
+        chunks = []
+        metadatas = []
+        embeddings = []
+        for text, source in zip(texts, sources):
+            text_chunks = _text_splitter().split_text(text)
+            for i, chunk in enumerate(text_chunks):
+                chunks.append(chunk)
+                metadatas.append({"source": source, "chunk_id": i})
+            if late_chunking:
+                embeddings.extend(self.embeddings.embed_chunks(text, text_chunks))
+        
+        return self._add_chunks(chunks, metadatas, embeddings if late_chunking else None)
+    
+    @staticmethod
+    def _chunk_id(content: str) -> str:
+        """Deterministic chunk ID derived from the chunk content"""
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+    
+    @classmethod
+    def _image_chunk_ids(cls, image_data: bytes, text: Optional[str], count: int) -> List[str]:
+        """
+        Deterministic IDs for image-derived chunks
+        
+        Vision output differs between runs, so these are keyed by the image
+        SHA-256, the accompanying text and the chunk index, not by content.
+        """
+        image_sha256 = hashlib.sha256(image_data).hexdigest()
+        return [cls._chunk_id(f"{image_sha256}\0{text or ''}\0{i}") for i in range(count)]
+    
+    def _add_chunks(
+        self,
+        chunks: List[str],
+        metadatas: List[Dict],
+        embeddings: Optional[List[List[float]]] = None,
+        ids: Optional[List[str]] = None
+    ) -> int:
+        """
+        Embed and upsert chunks keyed by content hash (or by the given IDs)
+        
+        Chunks already stored under the same ID are skipped, so re-ingesting
+        unchanged content costs one ID lookup and no embedding calls.
+        New chunks are embedded in as few requests as possible (see
+        _embedding_batches) and handed to _write_chunks in one go.
+        
+        Args:
+            chunks: Chunk texts
+            metadatas: Metadata for each chunk
+            embeddings: Precomputed embedding for each chunk, if available
+            ids: Chunk IDs to use instead of content hashes
+        
+        Returns:
+            Number of chunks that were newly embedded
+        """
+        # Collapse duplicate chunks within this call, keeping the first
+        pending = {}
+        for i, (chunk, metadata) in enumerate(zip(chunks, metadatas)):
+            vector = embeddings[i] if embeddings is not None else None
+            chunk_id = ids[i] if ids is not None else self._chunk_id(chunk)
+            pending.setdefault(chunk_id, (chunk, metadata, vector))
+        
+        if not pending:
+            return 0
+        
+        for chunk_id in self._existing_ids(list(pending)):
+            pending.pop(chunk_id, None)
+        
+        if not pending:
+            return 0
+        
+        ids = list(pending)
+        documents = [pending[chunk_id][0] for chunk_id in ids]
+        new_metadatas = [pending[chunk_id][1] for chunk_id in ids]
+        
+        if embeddings is not None:
+            new_embeddings = [pending[chunk_id][2] for chunk_id in ids]
+        else:
+            # Embed everything up front so the store never embeds
+            # one document at a time
+            new_embeddings = []
+            for batch in self._embedding_batches(documents):
+                new_embeddings.extend(self.embeddings.embed_documents(batch))
+        self._write_chunks(ids, documents, new_embeddings, new_metadatas)
+        self.sparse_index.add(ids, documents, new_metadatas)
+        
+        return len(ids)
+    
+    @staticmethod
+    def _embedding_batches(documents: List[str]) -> Iterator[List[str]]:
+        """
+        Group documents into embedding requests
+        
+        Each batch stays within the endpoint's input limit
+        (settings.embedding_batch_size) and a tiktoken-counted token budget
+        (settings.embedding_batch_max_tokens) so large ingests are not
+        rejected or rate limited.
+        """
+        settings = get_settings()
+        batch, batch_tokens = [], 0
+        for document, num_tokens in zip(documents, count_tokens(documents, settings.embedding_model)):
+            if batch and (
+                len(batch) >= settings.embedding_batch_size
+                or batch_tokens + num_tokens > settings.embedding_batch_max_tokens
+            ):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(document)
+            batch_tokens += num_tokens
+        
+        if batch:
+            yield batch
+    
+    def _existing_ids(self, ids: List[str]) -> List[str]:
+        """Return the subset of chunk IDs already stored"""
+        return self.vectorstore._collection.get(ids=ids, include=[])["ids"]
+    
+    def _stored_chunks(self) -> Iterator[tuple]:
+        """Yield (ids, documents, metadatas) batches of every stored chunk"""
+        settings = get_settings()
+        batch_size = settings.ingest_batch_size
+        offset = 0
+        while True:
+            batch = self.vectorstore._collection.get(
+                limit=batch_size, offset=offset, include=["documents", "metadatas"]
+            )
+            if not batch["ids"]:
+                return
+            yield batch["ids"], batch["documents"], batch["metadatas"]
+            offset += len(batch["ids"])
+    
+    def _write_chunks(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict]
+    ):
+        """Upsert pre-embedded chunks in batches of settings.ingest_batch_size"""
+        settings = get_settings()
+        batch_size = settings.ingest_batch_size
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self.vectorstore._collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end]
             )
-            for i, chunk in enumerate(chunks)
-        ]
-        self.vectorstore.add_documents(documents)
-        return len(documents)
     
     def ingest_multimodal(
         self,
         text: str = None,
-        image_data: str = None,
+        image_data: bytes = None,
         source: str = "user",
-        save_image: bool = True
+        save_image: bool = True,
+        mime: str = "image/jpeg"
     ) -> Dict[str, Any]:
         """
         Ingest multimodal content (text + image) into the vector store
         
         Args:
             text: Text content to ingest
-            image_data: Base64 encoded image data
+            image_data: Raw image bytes, decoded once by the caller
             source: Source identifier
             save_image: Whether to save image to disk
+            mime: Image MIME type
             
         Returns:
             Dict with ingestion results including image analysis
@@ -208,15 +621,28 @@ class ChromaRAGService:
         # Process image if provided
         if image_data:
             try:
-                # Generate image summary for embedding
-                image_summary = image_processor.generate_image_summary(image_data)
+                # The same image with the same text was ingested before; skip
+                # the vision call and embeddings entirely
+                if self._existing_ids(self._image_chunk_ids(image_data, text, 1)):
+                    result["image_id"] = get_image_processor()._generate_image_id(image_data)
+                    return result
                 
-                # Analyze image in detail
-                image_analysis = image_processor.analyze_medical_image(
-                    image_data=image_data,
+                # Analyze the image and summarize it for embedding in one vision call
+                image_analysis = get_image_processor().analyze_and_summarize(
+                    image_bytes=image_data,
+                    mime=mime,
                     query=text if text else None,
                     save_image=save_image
                 )
+                # Chunks are keyed by image, not content, so storing a failed
+                # analysis would make every retry stop at the check above
+                if not image_analysis["success"]:
+                    result["success"] = False
+                    result["image_id"] = image_analysis["image_id"]
+                    result["error"] = f"Image analysis failed: {image_analysis['error']}"
+                    return result
+                
+                image_summary = image_analysis.get("summary")
                 
                 result["image_analysis"] = image_analysis["analysis"]
                 result["image_id"] = image_analysis["image_id"]
@@ -226,26 +652,25 @@ class ChromaRAGService:
                 if text:
                     combined_text += f"Patient Query: {text}\n\n"
                 
-                combined_text += f"Medical Image Analysis:\n{image_summary}\n\n"
+                if image_summary:
+                    combined_text += f"Medical Image Analysis:\n{image_summary}\n\n"
                 combined_text += f"Detailed Findings:\n{image_analysis['analysis']}"
                 
                 # Ingest combined content
-                chunks = self.text_splitter.split_text(combined_text)
-                documents = [
-                    Document(
-                        page_content=chunk,
-                        metadata={
-                            "source": source,
-                            "chunk_id": i,
-                            "has_image": True,
-                            "image_id": image_analysis["image_id"],
-                            "type": "multimodal"
-                        }
-                    )
-                    for i, chunk in enumerate(chunks)
+                chunks = _text_splitter().split_text(combined_text)
+                metadatas = [
+                    {
+                        "source": source,
+                        "chunk_id": i,
+                        "has_image": True,
+                        "image_id": image_analysis["image_id"],
+                        "type": "multimodal"
+                    }
+                    for i in range(len(chunks))
                 ]
-                self.vectorstore.add_documents(documents)
-                result["text_chunks"] = len(documents)
+                result["text_chunks"] = self._add_chunks(
+                    chunks, metadatas, ids=self._image_chunk_ids(image_data, text, len(chunks))
+                )
                 
             except Exception as e:
                 result["success"] = False
@@ -261,9 +686,29 @@ class ChromaRAGService:
         """Perform similarity search in vector store"""
         return self.vectorstore.similarity_search(query, k=k)
     
-    def similarity_search_with_score(self, query: str, k: int = 4) -> List[tuple]:
+    def similarity_search_with_score(self, query: str, k: int = 4, where: Optional[Dict[str, Any]] = None) -> List[tuple]:
         """Perform similarity search with relevance scores"""
-        return self.vectorstore.similarity_search_with_score(query, k=k)
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k=k, where=where)
+    
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, where: Optional[Dict[str, Any]] = None
+    ) -> List[tuple]:
+        """
+        Perform similarity search for an already embedded query
+        
+        The where filter (metadata field -> required value) is applied by
+        Chroma during the HNSW walk, so all k results match it.
+        """
+        return self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=self._chroma_where(where)
+        )
+    
+    @staticmethod
+    def _chroma_where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Translate a flat equality filter to Chroma's where syntax"""
+        if not where or len(where) == 1:
+            return where or None
+        return {"$and": [{key: value} for key, value in where.items()]}
     
     def get_retriever(self, k: int = 4):
         """Get a retriever for the vector store"""
@@ -276,19 +721,306 @@ class ChromaRAGService:
         """Query the medical knowledge graph"""
         return self.knowledge_graph.query_graph(query)
     
-    def hybrid_search(self, query: str, k: int = 4) -> Dict[str, Any]:
-        """Perform hybrid search using both vector store and knowledge graph"""
-        vector_results = self.similarity_search_with_score(query, k=k)
+    def hybrid_search(self, query: str, k: int = 4, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Perform hybrid search over the vector store, BM25 index and knowledge graph
+        
+        Each retriever returns 2k candidates, which are fused with
+        Reciprocal Rank Fusion (see _hybrid_results).
+        
+        Args:
+            query: Search query
+            k: Number of fused results to return
+            where: Metadata filter (field -> required value) applied inside
+                the vector and BM25 searches; the graph is not filtered
+            
+        Returns:
+            Up to k results, best first, each with content, metadata, its
+            RRF score and the retrievers ("vector", "bm25", "graph") that
+            returned it
+        """
+        vector_results = self.similarity_search_with_score(query, k=2 * k, where=where)
+        sparse_results = self.sparse_index.search(query, k=2 * k, where=where)
         graph_results = self.query_knowledge_graph(query)
+        return self._hybrid_results(vector_results, sparse_results, graph_results, k)
+    
+    async def ahybrid_search(self, query: str, k: int = 4, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Async hybrid search
+        
+        The query is embedded with the async OpenAI client, and the vector
+        store and BM25 lookups run concurrently in worker threads, so the
+        event loop stays free for concurrent LLM calls.
+        """
+        async def vector_search() -> List[tuple]:
+            embedding = await self.embeddings.aembed_query(query)
+            return await asyncio.to_thread(self.similarity_search_by_vector_with_score, embedding, 2 * k, where)
         
-        return {
-            "vector_results": [
-                {
+        vector_results, sparse_results = await asyncio.gather(
+            vector_search(),
+            asyncio.to_thread(self.sparse_index.search, query, 2 * k, where)
+        )
+        graph_results = self.query_knowledge_graph(query)
+        return self._hybrid_results(vector_results, sparse_results, graph_results, k)
+    
+    @classmethod
+    def _hybrid_results(
+        cls,
+        vector_results: List[tuple],
+        sparse_results: List[tuple],
+        graph_results: str,
+        k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Fuse ranked retriever results with Reciprocal Rank Fusion
+        
+        A chunk scores 1 / (RRF_K + rank) for every list it appears in, so
+        chunks found by both the vector and BM25 search rise to the top.
+        The knowledge graph context is a single entry ranked first in its
+        own list.
+        """
+        ranked_lists = [
+            ("vector", [doc for doc, _ in vector_results]),
+            ("bm25", [doc for doc, _ in sparse_results]),
+        ]
+        if graph_results != NO_GRAPH_RESULTS:
+            ranked_lists.append(
+                ("graph", [Document(page_content=graph_results, metadata={"source": "knowledge_graph"})])
+            )
+        
+        fused: Dict[str, Dict[str, Any]] = {}
+        for retriever, docs in ranked_lists:
+            for rank, doc in enumerate(docs, start=1):
+                entry = fused.setdefault(cls._chunk_id(doc.page_content), {
                     "content": doc.page_content,
                     "metadata": doc.metadata,
-                    "score": score
-                }
-                for doc, score in vector_results
-            ],
-            "graph_results": graph_results
-        }
+                    "score": 0.0,
+                    "sources": []
+                })
+                if retriever not in entry["sources"]:
+                    entry["score"] += 1 / (RRF_K + rank)
+                    entry["sources"].append(retriever)
+        
+        return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)[:k]
+
+
+class _VectorStoreRetriever(BaseRetriever):
+    """Retriever backed by a RAG service's similarity_search"""
+    
+    service: Any
+    k: int = 4
+    
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.service.similarity_search(query, k=self.k)
+
+
+class FAISSRAGService(ChromaRAGService):
+    """
+    RAG Service with a FAISS vector store and Knowledge Graph
+    
+    Vectors live in a FAISS index persisted with write_index; chunk text and
+    metadata live in a side SQLite table keyed by the FAISS int ID. The
+    index starts flat, is quantized to int8 (SQ8) once there are enough
+    vectors to train the quantizer, and is rebuilt as IVF+PQ once
+    settings.faiss_train_size vectors are stored. With settings.faiss_mmap the persisted index is
+    memory-mapped read-only, so the OS page cache only holds hot lists.
+    """
+    
+    def _init_vector_store(self):
+        """Open the FAISS index and chunk table"""
+        settings = get_settings()
+        self.index_dir = Path(settings.faiss_index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.index_dir / "index.faiss"
+        self._lock = threading.Lock()
+        
+        self._db = sqlite3.connect(self.index_dir / "chunks.sqlite3", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._db.commit()
+        
+        self.index = None
+        if self.index_path.exists():
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if settings.faiss_mmap else 0
+            self.index = faiss.read_index(str(self.index_path), flags)
+    
+    def _existing_ids(self, ids: List[str]) -> List[str]:
+        """Return the subset of chunk IDs already stored"""
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", ids
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def _stored_chunks(self) -> Iterator[tuple]:
+        """Yield (ids, documents, metadatas) batches of every stored chunk"""
+        settings = get_settings()
+        with self._lock:
+            rows = self._db.execute("SELECT chunk_id, document, metadata FROM chunks ORDER BY id").fetchall()
+        batch_size = settings.ingest_batch_size
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            yield (
+                [row[0] for row in batch],
+                [row[1] for row in batch],
+                [json.loads(row[2]) for row in batch]
+            )
+    
+    def _write_chunks(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict]
+    ):
+        """Append pre-embedded chunks to the index and chunk table"""
+        settings = get_settings()
+        if settings.faiss_mmap:
+            raise RuntimeError("FAISS index is memory-mapped read-only; disable FAISS_MMAP to ingest")
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        
+        with self._lock:
+            cursor = self._db.cursor()
+            int_ids = []
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                cursor.execute(
+                    "INSERT INTO chunks (chunk_id, document, metadata) VALUES (?, ?, ?)",
+                    (chunk_id, document, json.dumps(metadata))
+                )
+                int_ids.append(cursor.lastrowid)
+            
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            self.index.add_with_ids(vectors, np.asarray(int_ids, dtype=np.int64))
+            
+            self.index = self._maybe_compress(self.index)
+            
+            faiss.write_index(self.index, str(self.index_path))
+            self._db.commit()
+    
+    def _maybe_compress(self, index: "faiss.Index") -> "faiss.Index":
+        """
+        Move stored vectors to a more compact index once there are enough to train it
+        
+        Flat FP32 -> SQ8 (int8 codes, ~4x smaller) after settings.faiss_sq_train_size
+        vectors when settings.faiss_quantization is "sq8", then IVF+PQ after
+        settings.faiss_train_size vectors.
+        """
+        settings = get_settings()
+        if not isinstance(index, faiss.IndexIDMap2):
+            return index
+        
+        dim = index.d
+        total = index.ntotal
+        if total >= settings.faiss_train_size:
+            # Keep enough training points per centroid for small corpora
+            nlist = max(1, min(settings.faiss_nlist, settings.faiss_train_size // 39))
+            quantizer = faiss.IndexFlatL2(dim)
+            ivfpq = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.faiss_pq_m, settings.faiss_pq_nbits)
+            ivfpq.nprobe = settings.faiss_nprobe
+            return self._rebuild_index(index, ivfpq)
+        
+        is_flat = isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+        if settings.faiss_quantization == "sq8" and is_flat and total >= settings.faiss_sq_train_size:
+            sq8 = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+            return self._rebuild_index(index, faiss.IndexIDMap2(sq8))
+        
+        return index
+    
+    def _rebuild_index(self, source: "faiss.IndexIDMap2", target: "faiss.Index") -> "faiss.Index":
+        """Train target on the vectors stored in source and copy them over with their IDs"""
+        settings = get_settings()
+        vectors = source.index.reconstruct_n(0, source.ntotal)
+        int_ids = faiss.vector_to_array(source.id_map)
+        target.train(vectors[:settings.faiss_train_size])
+        target.add_with_ids(vectors, int_ids)
+        return target
+    
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """Perform similarity search in vector store"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+    
+    def similarity_search_with_score(self, query: str, k: int = 4, where: Optional[Dict[str, Any]] = None) -> List[tuple]:
+        """Perform similarity search with L2 distance scores"""
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k=k, where=where)
+    
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, where: Optional[Dict[str, Any]] = None
+    ) -> List[tuple]:
+        """
+        Perform similarity search for an already embedded query
+        
+        With a where filter, the matching chunk IDs are looked up in SQLite
+        first and passed to FAISS as an ID selector, so only those vectors
+        are scored.
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        
+        query_vector = np.asarray([embedding], dtype=np.float32)
+        with self._lock:
+            params = None
+            if where:
+                clauses = " AND ".join(f"json_extract(metadata, ?) = ?" for _ in where)
+                args = [arg for key, value in where.items() for arg in (f"$.{key}", value)]
+                allowed = [row[0] for row in self._db.execute(f"SELECT id FROM chunks WHERE {clauses}", args)]
+                if not allowed:
+                    return []
+                params = self._search_params(allowed)
+            distances, int_ids = self.index.search(query_vector, k, params=params)
+            hits = [(int(i), float(d)) for i, d in zip(int_ids[0], distances[0]) if i != -1]
+            if not hits:
+                return []
+            
+            placeholders = ",".join("?" * len(hits))
+            rows = dict(
+                (row[0], row[1:])
+                for row in self._db.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE id IN ({placeholders})",
+                    [i for i, _ in hits]
+                )
+            )
+        
+        return [
+            (Document(page_content=rows[i][0], metadata=json.loads(rows[i][1])), distance)
+            for i, distance in hits
+            if i in rows
+        ]
+    
+    def _search_params(self, int_ids: List[int]) -> "faiss.SearchParameters":
+        """Search parameters restricting a FAISS search to the given IDs"""
+        selector = faiss.IDSelectorBatch(np.asarray(int_ids, dtype=np.int64))
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        # The parameters only hold a raw pointer; keep the selector alive with them
+        params.referenced_objects = [selector]
+        return params
+    
+    def get_retriever(self, k: int = 4):
+        """Get a retriever for the vector store"""
+        return _VectorStoreRetriever(service=self, k=k)
+
+
+def create_rag_service() -> ChromaRAGService:
+    """Create the RAG service for the configured vector store backend"""
+    settings = get_settings()
+    if settings.vector_store == "faiss":
+        return FAISSRAGService()
+    return ChromaRAGService()
+
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> ChromaRAGService:
+    """Return the process-wide RAG service, creating it on first use"""
+    return create_rag_service()
@@ -1,4 +1,4 @@
 """Vision service initialization"""
-from .image_processor import ImageProcessor, image_processor
+from .image_processor import ImageProcessor, get_image_processor, decode_data_url
 
-__all__ = ['ImageProcessor', 'image_processor']
+__all__ = ['ImageProcessor', 'get_image_processor', 'decode_data_url']
@@ -5,202 +5,599 @@ Handles image storage, analysis using OpenAI Vision API, and multimodal embeddin
 """
 
 import os
-import base64
-import hashlib
-import json
+import asyncio
+import logging
+import orjson
+import queue
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Union, BinaryIO
 from datetime import datetime
+from functools import lru_cache
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from src.core.config import settings
+import numpy as np
+from PIL import Image
+from blake3 import blake3
+from src.core.config import get_settings
+from src.core.http import get_http_client, get_async_http_client
+from src.services.vision.single_flight import SingleFlight
+from src.services.vision.kernels import window_and_cast
+
+try:
+    # SIMD-accelerated drop-in replacement for the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+logger = logging.getLogger(__name__)
+
+# Pending background image writes; when full, images are saved inline
+IMAGE_SAVE_QUEUE_SIZE = 256
+
+# Read size when hashing file-like image uploads
+IMAGE_HASH_CHUNK_SIZE = 64 * 1024
+
+# Vision prompts are built once; only a caller's query is filled in per request
+ANALYSIS_PROMPT = """You are a medical imaging assistant. Analyze this medical image.
+
+Please provide:
+1. Type of medical image (X-ray, CT scan, MRI, etc.)
+2. Body part or area shown
+3. Key findings and observations
+4. Any abnormalities or areas of concern
+5. Relevant medical features visible
+
+Be specific and detailed in your medical analysis."""
+
+ANALYSIS_QUERY_PROMPT_TEMPLATE = """You are a medical imaging assistant. Analyze this medical image and answer: {query}
+
+Please provide:
+1. Description of what you see in the image
+2. Any notable medical features or findings
+3. Relevant observations for medical assessment
+4. Any concerns or important details
+
+Be specific and medical in your analysis."""
+
+SUMMARY_JSON_INSTRUCTIONS = """
+
+Respond with a JSON object with exactly these keys:
+- "summary": the image described concisely in 2-3 sentences (image type, body part, key findings), formatted for text search and retrieval
+- "detailed_analysis": the full analysis requested above"""
+
+ANALYSIS_AND_SUMMARY_PROMPT = ANALYSIS_PROMPT + SUMMARY_JSON_INSTRUCTIONS
+
+# Pillow modes for 16/32-bit grayscale (DICOM exports, raw X-ray PNGs)
+HIGH_BIT_DEPTH_MODES = {"I", "I;16", "I;16L", "I;16B", "I;16N"}
+
+
+def write_atomic(path: Path, data: bytes):
+    """
+    Write a file via a temporary sibling and os.replace
+    
+    Readers see either the old or the new file, never a partial one, and
+    no fsync is needed for that. The temporary name is unique per process
+    and thread, so concurrent writers of the same path do not collide.
+    """
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def decode_data_url(image_data: str) -> Tuple[bytes, str]:
+    """
+    Decode a base64 image string once into raw bytes
+    
+    Args:
+        image_data: A data URL (data:image/png;base64,...) or bare base64
+        
+    Returns:
+        Tuple of (image bytes, MIME type); bare base64 is assumed to be JPEG
+        
+    Raises:
+        binascii.Error: If the payload is not strictly valid base64
+    """
+    if image_data.startswith('data:'):
+        header, encoded = image_data.split(',', 1)
+        mime = header[5:].split(';')[0] or 'image/jpeg'
+    else:
+        encoded = image_data
+        mime = 'image/jpeg'
+    return base64.b64decode(encoded, validate=True), mime
 
 
 class ImageProcessor:
     """Process and analyze medical images"""
     
     def __init__(self):
+        settings = get_settings()
         self.vision_model = ChatOpenAI(
             model=settings.vision_model,
             openai_api_key=settings.openai_api_key,
-            max_tokens=1000
+            max_tokens=1000,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client()
         )
+        # Same model in JSON mode, for calls that return several fields at once
+        self.json_vision_model = self.vision_model.bind(response_format={"type": "json_object"})
+        # Concurrent identical analyses, keyed by (image ID, prompt), share one call
+        self.vision_calls = SingleFlight(self.vision_model)
+        self.json_vision_calls = SingleFlight(self.json_vision_model)
         
         self.storage_dir = Path(settings.image_storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
         
-        # Create metadata directory
+        # Create metadata directory; files are sharded into YYYY/MM
+        # subdirectories by creation time (see _metadata_path)
         self.metadata_dir = self.storage_dir / "metadata"
         self.metadata_dir.mkdir(exist_ok=True)
+        
+        # Append-only log of metadata records (saves and deletion tombstones),
+        # replayed into an in-memory index ordered by save time. Every
+        # lookup first replays lines appended since the last read, so
+        # images saved by other worker processes show up too
+        self.index_path = self.metadata_dir / "index.jsonl"
+        self._index: "OrderedDict[str, Dict]" = OrderedDict()
+        self._index_inode = None
+        self._index_offset = 0
+        self._index_records = 0
+        self._index_lock = threading.Lock()
+        self._open_index()
+        
+        # Images are written by a background thread so responses do not wait on disk
+        self._save_queue: "queue.Queue[Tuple[bytes, str, str, Dict, str]]" = queue.Queue(maxsize=IMAGE_SAVE_QUEUE_SIZE)
+        threading.Thread(target=self._save_worker, name="image-saver", daemon=True).start()
+    
+    def _open_index(self):
+        """Load the index, building it from the metadata files of an older store and compacting it"""
+        if not self.index_path.exists():
+            records = []
+            for metadata_file in self.metadata_dir.rglob("*.json"):
+                with open(metadata_file, 'rb') as f:
+                    records.append(orjson.loads(f.read()))
+            records.sort(key=lambda record: record.get('created_at', ''))
+            self._write_index(records)
+        
+        with self._index_lock:
+            self._refresh_index()
+            if self._index_records > len(self._index):
+                self._write_index(list(self._index.values()))
+                self._refresh_index()
+    
+    def _write_index(self, records: List[Dict]):
+        """Atomically replace the index with the given records"""
+        write_atomic(self.index_path, b"".join(orjson.dumps(record) + b"\n" for record in records))
     
-    def _generate_image_id(self, image_data: str) -> str:
-        """Generate unique ID for image based on content hash"""
-        return hashlib.sha256(image_data.encode()).hexdigest()[:16]
+    def _append_index(self, record: Dict):
+        """Append one record to the index and replay it; call with _index_lock held"""
+        with open(self.index_path, 'ab') as f:
+            f.write(orjson.dumps(record) + b"\n")
+        self._refresh_index()
     
-    def _save_image(self, image_data: str, image_id: str, metadata: Dict = None) -> str:
-        """Save image and metadata to disk"""
-        # Determine image format from data URL
-        if image_data.startswith('data:'):
-            header, encoded = image_data.split(',', 1)
-            image_format = header.split(';')[0].split('/')[-1]
+    def _refresh_index(self):
+        """Replay index lines appended since the last read; call with _index_lock held"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+            # Replaced by a compaction; start over
+            self._index = OrderedDict()
+            self._index_inode = stat.st_ino
+            self._index_offset = 0
+            self._index_records = 0
+        if stat.st_size == self._index_offset:
+            return
+        
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Stop at the last complete line; another process may be mid-append
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            image_id = record['image_id']
+            self._index.pop(image_id, None)
+            if not record.get('deleted'):
+                self._index[image_id] = record
+            self._index_records += 1
+        self._index_offset += end
+    
+    def _generate_image_id(self, image: Union[bytes, memoryview, BinaryIO]) -> str:
+        """
+        Generate unique ID for image based on content hash
+        
+        A 16 hex digit BLAKE3 digest (multithreaded for large images). blake3
+        is a hard requirement, so the same image gets the same ID in every
+        environment. Bytes-like input is hashed in place without a copy;
+        file-like input is read and hashed in IMAGE_HASH_CHUNK_SIZE chunks.
+        """
+        hasher = blake3(max_threads=blake3.AUTO)
+        
+        if hasattr(image, 'read'):
+            for chunk in iter(lambda: image.read(IMAGE_HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
         else:
-            encoded = image_data
-            image_format = 'png'
+            hasher.update(image)
+        
+        return hasher.hexdigest(length=8)
+    
+    @staticmethod
+    def _data_url(image_bytes: bytes, mime: str) -> str:
+        """Encode image bytes as a data URL for the Vision API"""
+        return f"data:{mime};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+    
+    @staticmethod
+    def _prepare_vision_image(image_bytes: bytes, mime: str) -> Tuple[bytes, str]:
+        """
+        Downscale an image to settings.vision_max_edge for the Vision API
+        
+        Vision tokens grow with the number of image tiles, so oversized
+        uploads are shrunk and re-encoded as JPEG. High bit depth grayscale
+        is windowed to its full pixel range and cast to 8-bit first, which
+        Pillow's own conversion would clip. 8-bit images that already fit
+        (or that Pillow cannot read) are passed through unchanged.
+        """
+        settings = get_settings()
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            high_bit_depth = image.mode in HIGH_BIT_DEPTH_MODES
+            if max(image.size) <= settings.vision_max_edge and not high_bit_depth:
+                return image_bytes, mime
+            
+            if high_bit_depth:
+                image = Image.fromarray(window_and_cast(np.asarray(image)))
+            elif image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.thumbnail((settings.vision_max_edge, settings.vision_max_edge), Image.LANCZOS)
+            
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=settings.vision_jpeg_quality)
+            return buffer.getvalue(), "image/jpeg"
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return image_bytes, mime
+    
+    def _metadata_path(self, image_id: str, created_at: str = None) -> Path:
+        """Metadata file for an image, in the YYYY/MM shard of its ISO created_at (flat for older stores)"""
+        if not created_at:
+            return self.metadata_dir / f"{image_id}.json"
+        return self.metadata_dir / created_at[:4] / created_at[5:7] / f"{image_id}.json"
+    
+    def _image_path(self, image_id: str, mime: str) -> Path:
+        """Where an image is stored, known before it is written"""
+        return self.storage_dir / f"{image_id}.{mime.split('/')[-1]}"
+    
+    def _save_worker(self):
+        """Write queued images to disk"""
+        while True:
+            item = self._save_queue.get()
+            try:
+                self._save_image(*item)
+            except Exception:
+                logger.exception("Failed to save image %s", item[2])
+            finally:
+                self._save_queue.task_done()
+    
+    def _save_in_background(
+        self, image_bytes: bytes, mime: str, image_id: str, metadata: Dict = None, created_at: str = None
+    ) -> bool:
+        """Queue an image for the background writer; False if the queue is full and the caller must save inline"""
+        try:
+            self._save_queue.put_nowait((image_bytes, mime, image_id, metadata, created_at))
+            return True
+        except queue.Full:
+            return False
+    
+    def flush_saves(self):
+        """Block until every queued image has been written"""
+        self._save_queue.join()
+    
+    def _save_image(
+        self, image_bytes: bytes, mime: str, image_id: str, metadata: Dict = None, created_at: str = None
+    ) -> str:
+        """Save image and metadata to disk; created_at defaults to now (ISO format)"""
+        image_format = mime.split('/')[-1]
         
         # Save image file
-        image_path = self.storage_dir / f"{image_id}.{image_format}"
-        with open(image_path, 'wb') as f:
-            f.write(base64.b64decode(encoded))
+        image_path = self._image_path(image_id, mime)
+        write_atomic(image_path, image_bytes)
         
         # Save metadata
         metadata_info = {
             'image_id': image_id,
             'format': image_format,
             'path': str(image_path),
-            'created_at': datetime.now().isoformat(),
+            'created_at': created_at or datetime.now().isoformat(),
             'metadata': metadata or {}
         }
         
-        metadata_path = self.metadata_dir / f"{image_id}.json"
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata_info, f, indent=2)
+        metadata_path = self._metadata_path(image_id, metadata_info['created_at'])
+        metadata_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(metadata_path, orjson.dumps(metadata_info, option=orjson.OPT_INDENT_2))
+        
+        with self._index_lock:
+            self._refresh_index()
+            previous = self._index.get(image_id)
+            self._append_index(metadata_info)
+        
+        # A re-saved image may have its older metadata file in another shard
+        if previous is not None:
+            previous_path = self._metadata_path(image_id, previous.get('created_at'))
+            if previous_path != metadata_path:
+                previous_path.unlink(missing_ok=True)
         
         return str(image_path)
     
     def _load_image_metadata(self, image_id: str) -> Optional[Dict]:
-        """Load image metadata from disk"""
-        metadata_path = self.metadata_dir / f"{image_id}.json"
-        if metadata_path.exists():
-            with open(metadata_path, 'r') as f:
-                return json.load(f)
-        return None
+        """Look image metadata up in the index, falling back to its metadata file"""
+        with self._index_lock:
+            self._refresh_index()
+            metadata = self._index.get(image_id)
+        if metadata is not None:
+            return metadata
+        
+        # Try the open instead of stat-ing first; missing files are the rare case
+        metadata = self._read_metadata_file(self._metadata_path(image_id))
+        if metadata is None:
+            metadata_path = next(self.metadata_dir.glob(f"*/*/{image_id}.json"), None)
+            if metadata_path is not None:
+                metadata = self._read_metadata_file(metadata_path)
+        return metadata
+    
+    @staticmethod
+    def _read_metadata_file(metadata_path: Path) -> Optional[Dict]:
+        """Read a metadata file, or None if it does not exist"""
+        try:
+            with open(metadata_path, 'rb') as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+    
+    @staticmethod
+    def _analysis_prompt(query: str = None) -> str:
+        """Vision prompt for a detailed analysis"""
+        if query:
+            return ANALYSIS_QUERY_PROMPT_TEMPLATE.format(query=query)
+        return ANALYSIS_PROMPT
+    
+    @staticmethod
+    def _analysis_and_summary_prompt(query: str = None) -> str:
+        """Vision prompt for an analysis plus a retrieval summary, returned as JSON"""
+        if query:
+            return ANALYSIS_QUERY_PROMPT_TEMPLATE.format(query=query) + SUMMARY_JSON_INSTRUCTIONS
+        return ANALYSIS_AND_SUMMARY_PROMPT
+    
+    @staticmethod
+    def _parse_analysis_and_summary(content: str) -> Tuple[str, str]:
+        """Split a JSON vision response into (summary, detailed analysis); unparseable output is all analysis"""
+        try:
+            data = orjson.loads(content)
+            summary, analysis = data.get("summary"), data.get("detailed_analysis")
+        except (ValueError, AttributeError):
+            return "", content
+        if not analysis:
+            return "", content
+        return str(summary or ""), str(analysis)
+    
+    def _vision_message(
+        self,
+        prompt: str,
+        image_bytes: bytes,
+        mime: str,
+        detail: str = "high",
+        encoded: str = None
+    ) -> HumanMessage:
+        """
+        Build a multimodal message with the prompt and the downscaled image
+        
+        Args:
+            detail: OpenAI image detail level; "low" sends a single 512px tile
+            encoded: The data URL or base64 image_bytes were decoded from.
+                Sent as is when no downscaling is needed, instead of
+                encoding the bytes again
+        """
+        prepared_bytes, prepared_mime = self._prepare_vision_image(image_bytes, mime)
+        if encoded is not None and prepared_bytes is image_bytes:
+            data_url = encoded if encoded.startswith('data:') else f"data:{mime};base64,{encoded}"
+        else:
+            data_url = self._data_url(prepared_bytes, prepared_mime)
+        return HumanMessage(
+            content=[
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": data_url,
+                        "detail": detail
+                    }
+                }
+            ]
+        )
+    
+    def _queue_save(
+        self,
+        image_bytes: bytes,
+        mime: str,
+        image_id: str,
+        query: Optional[str],
+        save_image: bool,
+        created_at: str
+    ) -> Tuple[Optional[str], Optional[Tuple]]:
+        """
+        Queue the image save for an analysis if requested
+        
+        Returns:
+            Tuple of (image path or None, _save_image arguments if the save
+            queue was full and the caller must write the image itself, else None)
+        """
+        if not save_image:
+            return None, None
+        
+        save_args = (image_bytes, mime, image_id, {
+            'query': query,
+            'analyzed_at': created_at
+        }, created_at)
+        inline_save = None if self._save_in_background(*save_args) else save_args
+        return str(self._image_path(image_id, mime)), inline_save
     
     def analyze_medical_image(
         self,
-        image_data: str,
+        image_bytes: bytes,
+        mime: str = "image/jpeg",
         query: str = None,
-        save_image: bool = True
+        save_image: bool = True,
+        encoded: str = None
     ) -> Dict[str, Any]:
         """
         Analyze medical image using Vision API
         
         Args:
-            image_data: Base64 encoded image or data URL
+            image_bytes: Raw image bytes (see decode_data_url)
+            mime: Image MIME type
             query: Optional specific query about the image
             save_image: Whether to save the image to disk
+            encoded: Optional data URL or base64 the bytes were decoded
+                from; skips re-encoding images that need no downscaling
             
         Returns:
             Dict with analysis results and image metadata
         """
         # Generate image ID
-        image_id = self._generate_image_id(image_data)
+        image_id = self._generate_image_id(image_bytes)
+        # One timestamp for the saved metadata and the result
+        now = datetime.now().isoformat()
         
-        # Save image if requested
-        image_path = None
-        if save_image:
-            image_path = self._save_image(image_data, image_id, {
-                'query': query,
-                'analyzed_at': datetime.now().isoformat()
-            })
+        # Call Vision API
+        prompt = self._analysis_prompt(query)
+        message = self._vision_message(prompt, image_bytes, mime, encoded=encoded)
+        image_path, inline_save = self._queue_save(image_bytes, mime, image_id, query, save_image, now)
+        if inline_save:
+            self._save_image(*inline_save)
         
-        # Prepare vision prompt
-        if query:
-            prompt = f"""You are a medical imaging assistant. Analyze this medical image and answer: {query}
-
-Please provide:
-1. Description of what you see in the image
-2. Any notable medical features or findings
-3. Relevant observations for medical assessment
-4. Any concerns or important details
-
-Be specific and medical in your analysis."""
-        else:
-            prompt = """You are a medical imaging assistant. Analyze this medical image.
-
-Please provide:
-1. Type of medical image (X-ray, CT scan, MRI, etc.)
-2. Body part or area shown
-3. Key findings and observations
-4. Any abnormalities or areas of concern
-5. Relevant medical features visible
-
-Be specific and detailed in your medical analysis."""
+        try:
+            response = self.vision_calls.invoke((image_id, prompt), [message])
+            return self._analysis_result(image_id, image_path, query, timestamp=now, analysis=response.content)
+        except Exception as e:
+            return self._analysis_result(image_id, image_path, query, error=str(e))
+    
+    async def aanalyze_medical_image(
+        self,
+        image_bytes: bytes,
+        mime: str = "image/jpeg",
+        query: str = None,
+        save_image: bool = True,
+        encoded: str = None
+    ) -> Dict[str, Any]:
+        """Async version of analyze_medical_image; inline saves (queue full) run in a worker thread"""
+        image_id = self._generate_image_id(image_bytes)
+        # One timestamp for the saved metadata and the result
+        now = datetime.now().isoformat()
+        
+        # Resizing is CPU-bound, keep it off the event loop
+        prompt = self._analysis_prompt(query)
+        message = await asyncio.to_thread(self._vision_message, prompt, image_bytes, mime, encoded=encoded)
+        image_path, inline_save = self._queue_save(image_bytes, mime, image_id, query, save_image, now)
+        if inline_save:
+            await asyncio.to_thread(self._save_image, *inline_save)
         
-        # Call Vision API
         try:
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": image_data if image_data.startswith('data:') else f"data:image/jpeg;base64,{image_data}"
-                        }
-                    }
-                ]
-            )
-            
-            response = self.vision_model.invoke([message])
-            analysis = response.content
-            
-            return {
-                'image_id': image_id,
-                'image_path': image_path,
-                'analysis': analysis,
-                'query': query,
-                'timestamp': datetime.now().isoformat(),
-                'success': True
-            }
+            response = await self.vision_calls.ainvoke((image_id, prompt), [message])
+            return self._analysis_result(image_id, image_path, query, timestamp=now, analysis=response.content)
+        except Exception as e:
+            return self._analysis_result(image_id, image_path, query, error=str(e))
+    
+    def analyze_and_summarize(
+        self,
+        image_bytes: bytes,
+        mime: str = "image/jpeg",
+        query: str = None,
+        save_image: bool = True,
+        encoded: str = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze a medical image and summarize it for embedding in one Vision API call
+        
+        Args:
+            image_bytes: Raw image bytes (see decode_data_url)
+            mime: Image MIME type
+            query: Optional specific query about the image
+            save_image: Whether to save the image to disk
+            encoded: Optional data URL or base64 the bytes were decoded
+                from; skips re-encoding images that need no downscaling
             
+        Returns:
+            Dict like analyze_medical_image's, plus a 'summary' (empty if
+            the model did not return valid JSON)
+        """
+        image_id = self._generate_image_id(image_bytes)
+        # One timestamp for the saved metadata and the result
+        now = datetime.now().isoformat()
+        
+        prompt = self._analysis_and_summary_prompt(query)
+        message = self._vision_message(prompt, image_bytes, mime, encoded=encoded)
+        image_path, inline_save = self._queue_save(image_bytes, mime, image_id, query, save_image, now)
+        if inline_save:
+            self._save_image(*inline_save)
+        
+        try:
+            response = self.json_vision_calls.invoke((image_id, prompt), [message])
+            summary, analysis = self._parse_analysis_and_summary(response.content)
+            return self._analysis_result(image_id, image_path, query, timestamp=now, analysis=analysis, summary=summary)
         except Exception as e:
+            return self._analysis_result(image_id, image_path, query, error=str(e))
+    
+    def _analysis_result(
+        self,
+        image_id: str,
+        image_path: Optional[str],
+        query: str = None,
+        analysis: str = None,
+        error: str = None,
+        summary: str = None,
+        timestamp: str = None
+    ) -> Dict[str, Any]:
+        """Build the analysis result dict; timestamp defaults to now (ISO format)"""
+        if error is not None:
             return {
                 'image_id': image_id,
                 'image_path': image_path,
                 'analysis': None,
-                'error': str(e),
+                'error': error,
                 'success': False
             }
-    
-    def generate_image_summary(self, image_data: str) -> str:
-        """
-        Generate a concise summary of the image for embedding
         
-        Returns a text summary suitable for vector embedding
-        """
-        prompt = """Describe this medical image concisely in 2-3 sentences. 
-Focus on: image type, body part, key findings. 
-Format for text search and retrieval."""
-        
-        try:
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": image_data if image_data.startswith('data:') else f"data:image/jpeg;base64,{image_data}"
-                        }
-                    }
-                ]
-            )
-            
-            response = self.vision_model.invoke([message])
-            return response.content
-            
-        except Exception as e:
-            return f"Medical image (analysis error: {str(e)})"
+        result = {
+            'image_id': image_id,
+            'image_path': image_path,
+            'analysis': analysis,
+            'query': query,
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'success': True
+        }
+        if summary is not None:
+            result['summary'] = summary
+        return result
     
     def get_image_by_id(self, image_id: str) -> Optional[Dict]:
         """Retrieve image metadata by ID"""
         return self._load_image_metadata(image_id)
     
     def list_images(self, limit: int = 50) -> List[Dict]:
-        """List all stored images with metadata"""
-        images = []
-        for metadata_file in sorted(self.metadata_dir.glob("*.json"), reverse=True)[:limit]:
-            with open(metadata_file, 'r') as f:
-                images.append(json.load(f))
-        return images
+        """List stored images with metadata, most recently saved first"""
+        with self._index_lock:
+            self._refresh_index()
+            return list(islice(reversed(self._index.values()), limit))
     
     def delete_image(self, image_id: str) -> bool:
         """Delete image and its metadata"""
@@ -208,14 +605,14 @@ Format for text search and retrieval."""
             metadata = self._load_image_metadata(image_id)
             if metadata:
                 # Delete image file
-                image_path = Path(metadata['path'])
-                if image_path.exists():
-                    image_path.unlink()
+                Path(metadata['path']).unlink(missing_ok=True)
                 
                 # Delete metadata
-                metadata_path = self.metadata_dir / f"{image_id}.json"
-                if metadata_path.exists():
-                    metadata_path.unlink()
+                for metadata_path in (self._metadata_path(image_id, metadata.get('created_at')), self._metadata_path(image_id)):
+                    metadata_path.unlink(missing_ok=True)
+                
+                with self._index_lock:
+                    self._append_index({'image_id': image_id, 'deleted': True})
                 
                 return True
             return False
@@ -223,5 +620,7 @@ Format for text search and retrieval."""
             return False
 
 
-# Singleton instance
-image_processor = ImageProcessor()
+@lru_cache(maxsize=1)
+def get_image_processor() -> ImageProcessor:
+    """Return the process-wide image processor, creating it on first use"""
+    return ImageProcessor()
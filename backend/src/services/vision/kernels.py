@@ -0,0 +1,54 @@
+"""
+Pixel Kernels
+
+Bulk pixel conversions used when preparing images for the Vision API.
+With numba installed they run as fused, parallel compiled loops; without
+it they fall back to equivalent NumPy expressions.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True, boundscheck=False)
+    def _window_and_cast_kernel(src, lo, hi, out):
+        scale = 255.0 / (hi - lo)
+        for i in numba.prange(src.shape[0]):
+            for j in range(src.shape[1]):
+                v = float(src[i, j])
+                if v < lo:
+                    v = lo
+                elif v > hi:
+                    v = hi
+                out[i, j] = np.uint8((v - lo) * scale)
+
+
+def window_and_cast(src: np.ndarray, lo: float = None, hi: float = None) -> np.ndarray:
+    """
+    Clip a 2-D grayscale array to [lo, hi] and rescale it to uint8
+    
+    Args:
+        src: High bit depth pixels (e.g. 16-bit X-ray or CT data)
+        lo: Window floor, defaults to the darkest pixel
+        hi: Window ceiling, defaults to the brightest pixel
+    
+    Returns:
+        uint8 array of the same shape
+    """
+    lo = float(src.min()) if lo is None else float(lo)
+    hi = float(src.max()) if hi is None else float(hi)
+    if hi <= lo:
+        hi = lo + 1.0
+    
+    if numba is not None:
+        out = np.empty(src.shape, dtype=np.uint8)
+        _window_and_cast_kernel(src, lo, hi, out)
+        return out
+    
+    scaled = (np.clip(src, lo, hi, dtype=np.float32) - lo) * np.float32(255.0 / (hi - lo))
+    return scaled.astype(np.uint8)
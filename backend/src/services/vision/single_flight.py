@@ -0,0 +1,88 @@
+"""
+Vision Call Deduplication
+
+Identical Vision API requests (same image and prompt) that are in flight
+at the same time share one model call. Requests are sent straight to the
+model's invoke()/ainvoke() with no batching window, so a lone request
+costs nothing extra.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, List
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+
+
+class SingleFlight:
+    """Single-flight deduplication in front of a chat model"""
+    
+    def __init__(self, model: Runnable):
+        """
+        Args:
+            model: Chat model (or bound runnable) the calls are sent to
+        """
+        self.model = model
+        self._inflight: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+    
+    def invoke(self, key: Hashable, messages: List[BaseMessage]) -> Any:
+        """
+        Call the model, or wait for the identical call already in flight
+        
+        Args:
+            key: Identifies the request; concurrent requests with equal keys share one call
+            messages: Messages for the model
+        
+        Returns:
+            The model response
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+        
+        try:
+            response = self.model.invoke(messages)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._lock:
+                del self._inflight[key]
+    
+    async def ainvoke(self, key: Hashable, messages: List[BaseMessage]) -> Any:
+        """Async version of invoke, sharing calls between coroutines on the running loop"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.model.ainvoke(messages))
+            self._tasks[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._forget(key, done))
+        
+        self._waiters[key] += 1
+        try:
+            # One waiter giving up must not cancel the call for the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # ...but the call is cancelled once nobody is waiting for it
+            if self._tasks.get(key) is task and self._waiters[key] == 1:
+                task.cancel()
+            raise
+        finally:
+            if self._tasks.get(key) is task:
+                self._waiters[key] -= 1
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            del self._waiters[key]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the triage agent graph
+
+Runs the LangGraph workflow with recording stand-ins for the LLM calls
+and the RAG service, so no server or OpenAI API key is needed.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# Keep the image store out of the working tree and avoid the semantic cache,
+# which would embed queries through the OpenAI API
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("IMAGE_STORAGE_DIR", tempfile.mkdtemp(prefix="triage-test-"))
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+from langchain_core.messages import AIMessage
+from src.services.agents.service import DEFAULT_DECISION, DOCTOR_REFERRAL_SYSTEM_MESSAGE, MedicalTriageAgent
+
+HISTORY = [
+    {"role": "user", "content": "I have had a headache since yesterday"},
+    {"role": "assistant", "content": "Is the pain on one side or both sides?"},
+    {"role": "user", "content": "Both sides, and I feel tired"},
+    {"role": "assistant", "content": "Have you been drinking enough water?"}
+]
+MESSAGE = "Not really, maybe two glasses a day"
+
+class FakeRAGService:
+    """Returns no search results"""
+    async def ahybrid_search(self, query, k=4, where=None):
+        return []
+
+class FakeDecisionLLM:
+    """Structured triage call returning a fixed decision"""
+    def __init__(self, decision):
+        self.decision = decision
+    
+    async def ainvoke(self, messages):
+        return {"parsed": self.decision}
+
+class RecordingLLM:
+    """Chat model stand-in that keeps the messages of every call"""
+    def __init__(self):
+        self.calls = []
+    
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        return AIMessage(content="Drink more water and rest.")
+
+def print_section(title):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f" {title}")
+    print("=" * 60)
+
+def run_responder(**decision):
+    """Run one chat turn with the given router decision and return the responder's messages"""
+    agent = MedicalTriageAgent(FakeRAGService())
+    # Validate like a parsed LLM response would be
+    agent.decision_llm = FakeDecisionLLM(DEFAULT_DECISION.model_validate({**DEFAULT_DECISION.model_dump(), **decision}))
+    agent.llm = RecordingLLM()
+    asyncio.run(agent.process_message(MESSAGE, history=HISTORY))
+    assert len(agent.llm.calls) == 1, f"expected one responder call, got {len(agent.llm.calls)}"
+    return agent.llm.calls[0]
+
+def test_history_seen_once(description, **decision):
+    """Test that the responder gets every history turn exactly once"""
+    print_section(f"Testing History Reaches the Responder Once ({description})")
+    
+    try:
+        messages = run_responder(**decision)
+        contents = [str(m.content) for m in messages]
+        # System prompt, the history turns, then the prompt carrying the current query
+        counts = {turn["content"]: contents.count(turn["content"]) for turn in HISTORY}
+        query_count = sum(MESSAGE in content for content in contents)
+        print(f"Responder messages: {len(messages)}")
+        print(f"History turn counts: {list(counts.values())}")
+        print(f"Current query count: {query_count}")
+        
+        passed = len(messages) == len(HISTORY) + 2 and all(c == 1 for c in counts.values()) and query_count == 1
+        print("✅ Passed" if passed else "❌ Failed")
+        return passed
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return False
+
+def test_risk_level_follows_score():
+    """Test that a high risk score is referred even if the model labels it low risk"""
+    print_section("Testing Risk Level Follows the Risk Score")
+    
+    try:
+        messages = run_responder(risk_score=8, risk_level="low", needs_clarification=False)
+        passed = messages[0] is DOCTOR_REFERRAL_SYSTEM_MESSAGE
+        print(f"Responder system prompt: {messages[0].content[:60]}...")
+        print("✅ Passed" if passed else "❌ Failed")
+        return passed
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return False
+
+def main():
+    """Run all tests"""
+    print("\n" + "=" * 60)
+    print(" Triage Agent Graph - Offline Tests")
+    print("=" * 60)
+    
+    results = [
+        ("Self-care (via RAG)", test_history_seen_once(
+            "self-care via RAG", risk_score=2, risk_level="low", needs_clarification=False)),
+        ("Self-care (RAG skipped)", test_history_seen_once(
+            "self-care, RAG skipped", risk_score=2, risk_level="low", needs_clarification=False,
+            retrieval_needed=False)),
+        ("Clarification", test_history_seen_once(
+            "clarification", risk_score=4, risk_level="medium", needs_clarification=True)),
+        ("Doctor referral", test_history_seen_once(
+            "doctor referral", risk_score=6, risk_level="medium", needs_clarification=False)),
+        ("Emergency (RAG skipped)", test_history_seen_once(
+            "emergency, RAG skipped", risk_score=9, risk_level="high", needs_clarification=False,
+            emergency=True)),
+        ("Risk level follows score", test_risk_level_follows_score())
+    ]
+    
+    print_section("Test Summary")
+    passed = sum(1 for _, result in results if result)
+    for name, result in results:
+        print(f"{'✅' if result else '❌'} {name}")
+    print(f"\nPassed: {passed}/{len(results)}")
+    
+    return 0 if passed == len(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
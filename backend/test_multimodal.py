@@ -10,18 +10,21 @@ Tests the complete multimodal functionality including:
 - Image storage and retrieval
 """
 
-import requests
+import argparse
 import json
 import base64
 import sys
+from functools import lru_cache
 from pathlib import Path
 from io import BytesIO
 from PIL import Image
+from live_test_utils import SESSION, CapturedOutput, run_parallel, run_test
 
 BASE_URL = "http://localhost:8000"
 
+@lru_cache(maxsize=1)
 def create_test_image():
-    """Create a simple test image (for demo purposes)"""
+    """Create a simple test image (for demo purposes); built once and shared by the tests"""
     # Create a simple colored image
     img = Image.new('RGB', (100, 100), color=(73, 109, 137))
     
@@ -40,13 +43,14 @@ def print_section(title):
 
 def test_text_only_chat():
     """Test 1: Text-only medical query"""
-    print_section("Test 1: Text-Only Medical Query")
+    out = CapturedOutput(width=70)
+    out.section("Test 1: Text-Only Medical Query")
     
     query = "I have a mild headache and feel tired. What should I do?"
-    print(f"Query: {query}\n")
+    out.print(f"Query: {query}\n")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/chat",
             json={
                 "message": query,
@@ -57,33 +61,34 @@ def test_text_only_chat():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Response received:")
-            print(f"{result['response'][:300]}...")
-            return True
+            out.print("✓ Response received:")
+            out.print(f"{result['response'][:300]}...")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            print(response.text)
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            out.print(response.text)
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_image_analysis():
     """Test 2: Image-only analysis"""
-    print_section("Test 2: Medical Image Analysis")
+    out = CapturedOutput(width=70)
+    out.section("Test 2: Medical Image Analysis")
     
-    print("Note: Using a test image. Replace with real X-ray for actual testing.\n")
+    out.print("Note: Using a test image. Replace with real X-ray for actual testing.\n")
     
     # Create test image
     test_image = create_test_image()
     
     query = "What do you see in this medical image?"
-    print(f"Query: {query}")
-    print(f"Image: Test image attached\n")
+    out.print(f"Query: {query}")
+    out.print(f"Image: Test image attached\n")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/chat",
             json={
                 "message": query,
@@ -94,30 +99,31 @@ def test_image_analysis():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Response received:")
-            print(f"{result['response'][:300]}...")
-            return True
+            out.print("✓ Response received:")
+            out.print(f"{result['response'][:300]}...")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            print(response.text)
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            out.print(response.text)
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_multimodal_query():
     """Test 3: Combined text + image query"""
-    print_section("Test 3: Multimodal Query (Text + Image)")
+    out = CapturedOutput(width=70)
+    out.section("Test 3: Multimodal Query (Text + Image)")
     
     test_image = create_test_image()
     
     query = "I have chest pain and difficulty breathing. Here's my chest X-ray."
-    print(f"Query: {query}")
-    print(f"Image: Test X-ray attached\n")
+    out.print(f"Query: {query}")
+    out.print(f"Image: Test X-ray attached\n")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/chat",
             json={
                 "message": query,
@@ -128,25 +134,26 @@ def test_multimodal_query():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Response received:")
-            print(f"{result['response'][:300]}...")
-            print("\nThe system should:")
-            print("  1. Analyze the image using Vision AI")
-            print("  2. Consider both symptoms AND image findings")
-            print("  3. Provide risk assessment based on both")
-            return True
+            out.print("✓ Response received:")
+            out.print(f"{result['response'][:300]}...")
+            out.print("\nThe system should:")
+            out.print("  1. Analyze the image using Vision AI")
+            out.print("  2. Consider both symptoms AND image findings")
+            out.print("  3. Provide risk assessment based on both")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            print(response.text)
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            out.print(response.text)
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_multimodal_ingestion():
     """Test 4: Ingest medical content with image"""
-    print_section("Test 4: Multimodal Content Ingestion")
+    out = CapturedOutput(width=70)
+    out.section("Test 4: Multimodal Content Ingestion")
     
     test_image = create_test_image()
     
@@ -167,10 +174,10 @@ def test_multimodal_ingestion():
     Treatment: Antibiotics, rest, fluids
     """
     
-    print("Ingesting case study with X-ray image...\n")
+    out.print("Ingesting case study with X-ray image...\n")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/ingest",
             json={
                 "text": text,
@@ -182,29 +189,30 @@ def test_multimodal_ingestion():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Ingestion successful:")
-            print(f"  - Success: {result['success']}")
-            print(f"  - Text chunks: {result['text_chunks']}")
-            print(f"  - Image ID: {result.get('image_id', 'N/A')}")
+            out.print("✓ Ingestion successful:")
+            out.print(f"  - Success: {result['success']}")
+            out.print(f"  - Text chunks: {result['text_chunks']}")
+            out.print(f"  - Image ID: {result.get('image_id', 'N/A')}")
             
             if result.get('image_analysis'):
-                print(f"  - Image analyzed: Yes")
-                print(f"  - Analysis preview: {result['image_analysis'][:100]}...")
+                out.print(f"  - Image analyzed: Yes")
+                out.print(f"  - Analysis preview: {result['image_analysis'][:100]}...")
             
-            print(f"\n  Message: {result['message']}")
-            return True
+            out.print(f"\n  Message: {result['message']}")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            print(response.text)
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            out.print(response.text)
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_text_only_ingestion():
     """Test 5: Ingest text-only content"""
-    print_section("Test 5: Text-Only Ingestion")
+    out = CapturedOutput(width=70)
+    out.section("Test 5: Text-Only Ingestion")
     
     text = """
     Dehydration Prevention Tips
@@ -222,10 +230,10 @@ def test_text_only_ingestion():
     - Monitor urine color
     """
     
-    print("Ingesting medical text...\n")
+    out.print("Ingesting medical text...\n")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/ingest",
             json={
                 "text": text,
@@ -235,22 +243,23 @@ def test_text_only_ingestion():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Ingestion successful:")
-            print(f"  - Text chunks: {result['text_chunks']}")
-            print(f"  - Message: {result['message']}")
-            return True
+            out.print("✓ Ingestion successful:")
+            out.print(f"  - Text chunks: {result['text_chunks']}")
+            out.print(f"  - Message: {result['message']}")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            print(response.text)
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            out.print(response.text)
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_real_image_file():
     """Test 6: Load and test with real image file (if available)"""
-    print_section("Test 6: Real Image File (Optional)")
+    out = CapturedOutput(width=70)
+    out.section("Test 6: Real Image File (Optional)")
     
     # Look for test images in common locations
     test_paths = [
@@ -266,13 +275,13 @@ def test_real_image_file():
             break
     
     if not image_path:
-        print("No test image file found. Skipping this test.")
-        print("\nTo test with real images:")
-        print("1. Save a medical image as 'test_xray.jpg'")
-        print("2. Run this test again")
-        return True  # Not a failure, just skipped
+        out.print("No test image file found. Skipping this test.")
+        out.print("\nTo test with real images:")
+        out.print("1. Save a medical image as 'test_xray.jpg'")
+        out.print("2. Run this test again")
+        return out.result(True)  # Not a failure, just skipped
     
-    print(f"Found test image: {image_path}\n")
+    out.print(f"Found test image: {image_path}\n")
     
     try:
         # Load real image
@@ -281,7 +290,7 @@ def test_real_image_file():
             image_data = f"data:image/jpeg;base64,{image_data}"
         
         # Analyze it
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/chat",
             json={
                 "message": "Please analyze this medical image in detail.",
@@ -292,40 +301,41 @@ def test_real_image_file():
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ Real image analyzed successfully:")
-            print(f"{result['response'][:400]}...")
-            return True
+            out.print("✓ Real image analyzed successfully:")
+            out.print(f"{result['response'][:400]}...")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
 def test_health_check():
     """Test 7: System health check"""
-    print_section("Test 7: System Health Check")
+    out = CapturedOutput(width=70)
+    out.section("Test 7: System Health Check")
     
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = SESSION.get(f"{BASE_URL}/health")
         
         if response.status_code == 200:
             result = response.json()
-            print("✓ System status:")
-            print(f"  - Overall: {result['status']}")
-            print(f"  - RAG Service: {result['rag_service']}")
-            print(f"  - Agent Service: {result['agent_service']}")
-            return True
+            out.print("✓ System status:")
+            out.print(f"  - Overall: {result['status']}")
+            out.print(f"  - RAG Service: {result['rag_service']}")
+            out.print(f"  - Agent Service: {result['agent_service']}")
+            return out.result(True)
         else:
-            print(f"✗ Error: {response.status_code}")
-            return False
+            out.print(f"✗ Error: {response.status_code}")
+            return out.result(False)
             
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        out.print(f"✗ Error: {e}")
+        return out.result(False)
 
-def main():
+def main(interactive=False):
     """Run all tests"""
     print("\n" + "🏥" * 35)
     print(" Multimodal Medical Triage System - Test Suite")
@@ -333,18 +343,21 @@ def main():
     
     print(f"\nServer URL: {BASE_URL}")
     print("Make sure the server is running: python -m src.main")
-    input("\nPress Enter to start tests...")
-    
-    results = []
-    
-    # Run tests
-    results.append(("Health Check", test_health_check()))
-    results.append(("Text-Only Chat", test_text_only_chat()))
-    results.append(("Image Analysis", test_image_analysis()))
-    results.append(("Multimodal Query", test_multimodal_query()))
-    results.append(("Multimodal Ingestion", test_multimodal_ingestion()))
-    results.append(("Text-Only Ingestion", test_text_only_ingestion()))
-    results.append(("Real Image File", test_real_image_file()))
+    if interactive:
+        input("\nPress Enter to start tests...")
+    
+    # Chat and health tests are independent HTTP round trips, so they run concurrently
+    results = run_parallel([
+        ("Health Check", test_health_check),
+        ("Text-Only Chat", test_text_only_chat),
+        ("Image Analysis", test_image_analysis),
+        ("Multimodal Query", test_multimodal_query),
+        ("Real Image File", test_real_image_file),
+    ])
+    
+    # Ingestion changes the knowledge base, so it runs after the queries
+    results.append(("Multimodal Ingestion", run_test(test_multimodal_ingestion)))
+    results.append(("Text-Only Ingestion", run_test(test_text_only_ingestion)))
     
     # Summary
     print_section("Test Summary")
@@ -370,8 +383,16 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test the running multimodal Medical Triage System")
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Wait for Enter before starting the tests"
+    )
+    args = parser.parse_args()
+    
     try:
-        sys.exit(main())
+        sys.exit(main(interactive=args.interactive))
     except KeyboardInterrupt:
         print("\n\nTests interrupted by user.")
         sys.exit(1)
@@ -5,9 +5,10 @@ Test script for the Medical Triage System
 Run this after starting the server to verify all components work correctly.
 """
 
-import requests
+import argparse
 import json
 import sys
+from live_test_utils import SESSION, CapturedOutput, run_parallel, run_test
 
 BASE_URL = "http://localhost:8000"
 
@@ -19,24 +20,26 @@ def print_section(title):
 
 def test_health_check():
     """Test the health check endpoint"""
-    print_section("Testing Health Check")
+    out = CapturedOutput()
+    out.section("Testing Health Check")
     
     try:
-        response = requests.get(f"{BASE_URL}/health")
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
-        return response.status_code == 200
+        response = SESSION.get(f"{BASE_URL}/health")
+        out.print(f"Status: {response.status_code}")
+        out.print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return out.result(response.status_code == 200)
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+        out.print(f"❌ Error: {e}")
+        return out.result(False)
 
 def test_chat(message, description):
     """Test the chat endpoint"""
-    print_section(f"Testing Chat: {description}")
-    print(f"Query: {message}")
+    out = CapturedOutput()
+    out.section(f"Testing Chat: {description}")
+    out.print(f"Query: {message}")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/chat",
             json={
                 "message": message,
@@ -45,75 +48,74 @@ def test_chat(message, description):
             }
         )
         
-        print(f"\nStatus: {response.status_code}")
+        out.print(f"\nStatus: {response.status_code}")
         if response.status_code == 200:
             result = response.json()
-            print(f"\nResponse:\n{result['response']}")
-            return True
+            out.print(f"\nResponse:\n{result['response']}")
+            return out.result(True)
         else:
-            print(f"Error: {response.text}")
-            return False
+            out.print(f"Error: {response.text}")
+            return out.result(False)
             
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+        out.print(f"❌ Error: {e}")
+        return out.result(False)
 
 def test_knowledge_graph_query():
     """Test the knowledge graph query endpoint"""
-    print_section("Testing Knowledge Graph Query")
+    out = CapturedOutput()
+    out.section("Testing Knowledge Graph Query")
     
     query = "fever"
-    print(f"Query: {query}")
+    out.print(f"Query: {query}")
     
     try:
-        response = requests.get(
+        response = SESSION.get(
             f"{BASE_URL}/knowledge-graph/query",
             params={"query": query}
         )
         
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
-        return response.status_code == 200
+        out.print(f"Status: {response.status_code}")
+        out.print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return out.result(response.status_code == 200)
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+        out.print(f"❌ Error: {e}")
+        return out.result(False)
 
 def test_hybrid_search():
     """Test the hybrid search endpoint"""
-    print_section("Testing Hybrid Search")
+    out = CapturedOutput()
+    out.section("Testing Hybrid Search")
     
     query = "cough and fever"
-    print(f"Query: {query}")
+    out.print(f"Query: {query}")
     
     try:
-        response = requests.get(
+        response = SESSION.get(
             f"{BASE_URL}/knowledge-graph/search",
             params={"query": query, "k": 3}
         )
         
-        print(f"Status: {response.status_code}")
+        out.print(f"Status: {response.status_code}")
         result = response.json()
         
-        # Print vector results
-        print(f"\nVector Results ({len(result['results']['vector_results'])} found):")
-        for i, vr in enumerate(result['results']['vector_results'][:2], 1):
-            print(f"\n{i}. Score: {vr['score']:.4f}")
-            print(f"   Content: {vr['content'][:150]}...")
+        # Print fused results
+        out.print(f"\nResults ({len(result['results'])} found):")
+        for i, r in enumerate(result['results'], 1):
+            out.print(f"\n{i}. Score: {r['score']:.4f} (via {', '.join(r['sources'])})")
+            out.print(f"   Content: {r['content'][:150]}...")
         
-        # Print graph results
-        print(f"\nGraph Results:")
-        print(result['results']['graph_results'])
-        
-        return response.status_code == 200
+        return out.result(response.status_code == 200)
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+        out.print(f"❌ Error: {e}")
+        return out.result(False)
 
 def test_ingest():
     """Test the ingest endpoint"""
-    print_section("Testing Content Ingestion")
+    out = CapturedOutput()
+    out.section("Testing Content Ingestion")
     
     medical_content = """
     Strep Throat is a bacterial infection that causes inflammation and pain in the throat.
@@ -129,7 +131,7 @@ def test_ingest():
     """
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/ingest",
             json={
                 "text": medical_content,
@@ -137,15 +139,15 @@ def test_ingest():
             }
         )
         
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
-        return response.status_code == 200
+        out.print(f"Status: {response.status_code}")
+        out.print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return out.result(response.status_code == 200)
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return False
+        out.print(f"❌ Error: {e}")
+        return out.result(False)
 
-def main():
+def main(interactive=False):
     """Run all tests"""
     print("\n" + "🏥" * 30)
     print("Medical Triage System - Test Suite")
@@ -153,57 +155,41 @@ def main():
     
     print(f"\nServer URL: {BASE_URL}")
     print("Make sure the server is running before proceeding.")
-    input("\nPress Enter to start tests...")
-    
-    results = []
-    
-    # Test 1: Health check
-    results.append(("Health Check", test_health_check()))
-    
-    # Test 2: Out of scope query (should be rejected)
-    results.append((
-        "Out of Scope Query",
-        test_chat(
+    if interactive:
+        input("\nPress Enter to start tests...")
+    
+    # Read-only tests are independent HTTP round trips, so they run concurrently
+    results = run_parallel([
+        # Test 1: Health check
+        ("Health Check", test_health_check),
+        # Test 2: Out of scope query (should be rejected)
+        ("Out of Scope Query", lambda: test_chat(
             "What's the weather today?",
             "Out of scope (should reject)"
-        )
-    ))
-    
-    # Test 3: Low-risk query (self-care)
-    results.append((
-        "Low-Risk Query",
-        test_chat(
+        )),
+        # Test 3: Low-risk query (self-care)
+        ("Low-Risk Query", lambda: test_chat(
             "I have a mild headache. What can I do?",
             "Low-risk symptoms (self-care advice)"
-        )
-    ))
-    
-    # Test 4: Medium-risk query (doctor consultation)
-    results.append((
-        "Medium-Risk Query",
-        test_chat(
+        )),
+        # Test 4: Medium-risk query (doctor consultation)
+        ("Medium-Risk Query", lambda: test_chat(
             "I've had a persistent cough for 2 weeks with some chest discomfort",
             "Medium-risk symptoms (doctor referral)"
-        )
-    ))
-    
-    # Test 5: High-risk query (immediate attention)
-    results.append((
-        "High-Risk Query",
-        test_chat(
+        )),
+        # Test 5: High-risk query (immediate attention)
+        ("High-Risk Query", lambda: test_chat(
             "I'm experiencing severe chest pain and difficulty breathing",
             "High-risk symptoms (emergency)"
-        )
-    ))
+        )),
+        # Test 6: Knowledge graph query
+        ("Knowledge Graph Query", test_knowledge_graph_query),
+        # Test 7: Hybrid search
+        ("Hybrid Search", test_hybrid_search),
+    ])
     
-    # Test 6: Knowledge graph query
-    results.append(("Knowledge Graph Query", test_knowledge_graph_query()))
-    
-    # Test 7: Hybrid search
-    results.append(("Hybrid Search", test_hybrid_search()))
-    
-    # Test 8: Content ingestion
-    results.append(("Content Ingestion", test_ingest()))
+    # Test 8: Content ingestion changes the knowledge base, so it runs last
+    results.append(("Content Ingestion", run_test(test_ingest)))
     
     # Summary
     print_section("Test Summary")
@@ -224,8 +210,16 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test the running Medical Triage System")
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Wait for Enter before starting the tests"
+    )
+    args = parser.parse_args()
+    
     try:
-        sys.exit(main())
+        sys.exit(main(interactive=args.interactive))
     except KeyboardInterrupt:
         print("\n\nTests interrupted by user.")
         sys.exit(1)